@@ -0,0 +1,219 @@
+"""MCP 传输开销基准测试
+
+启动一个本地的回显/固定负载 MCP 服务器，分别通过 stdio、sse 和 http（可流式 HTTP）
+传输，以不同的并发数和负载大小驱动 MCPConnection.call_tool，并输出每秒操作数和
+延迟直方图，便于为生产环境选择传输方式。
+
+用法：
+    python benchmark_transports.py
+    python benchmark_transports.py -t stdio http -c 1 8 32 -s 64 65536 -n 500
+"""
+
+import argparse
+import asyncio
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+from connections import create_connection
+from report import percentile
+
+HISTOGRAM_BUCKETS_MS = [0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+
+def serve(transport: str, port: int):
+    """运行基准测试用的 MCP 服务器（在子进程中调用）。"""
+    from mcp.server.fastmcp import FastMCP
+
+    mcp = FastMCP("transport-benchmark", port=port, log_level="WARNING")
+
+    @mcp.tool()
+    def echo(text: str) -> str:
+        """原样返回输入文本。"""
+        return text
+
+    @mcp.tool()
+    def payload(size: int) -> str:
+        """返回指定字节数的固定负载。"""
+        return "x" * size
+
+    mcp.run(transport={"http": "streamable-http"}.get(transport, transport))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def wait_for_port(port: int, timeout: float = 15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            await writer.wait_closed()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise TimeoutError(f"基准服务器未在 {timeout}s 内监听端口 {port}")
+
+
+class BenchmarkServer:
+    """为指定传输准备服务器，并返回连接到它的 MCPConnection。
+
+    stdio 由连接自己启动子进程；sse/http 在此启动一个监听本地端口的子进程。
+    """
+
+    def __init__(self, transport: str):
+        self.transport = transport
+        self.process = None
+        self.port = None
+
+    async def __aenter__(self):
+        if self.transport != "stdio":
+            self.port = free_port()
+            self.process = subprocess.Popen(
+                [sys.executable, str(Path(__file__).resolve()), "--serve", self.transport, "--port", str(self.port)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            await wait_for_port(self.port)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self.process:
+            self.process.terminate()
+            self.process.wait(timeout=10)
+
+    def connect(self):
+        if self.transport == "stdio":
+            return create_connection(
+                "stdio", command=sys.executable, args=[str(Path(__file__).resolve()), "--serve", "stdio"]
+            )
+        path = "/sse" if self.transport == "sse" else "/mcp"
+        return create_connection(self.transport, url=f"http://127.0.0.1:{self.port}{path}")
+
+
+async def run_case(connection: Any, concurrency: int, size: int, requests: int) -> dict[str, Any]:
+    """以给定并发数发送 requests 次调用，返回延迟和吞吐量统计。"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    errors = 0
+
+    async def one_call():
+        nonlocal errors
+        async with semaphore:
+            start_ts = time.perf_counter()
+            try:
+                result = await connection.call_tool("payload", {"size": size})
+                if getattr(result[0], "text", None) is None or len(result[0].text) != size:
+                    raise ValueError("负载大小不匹配")
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - start_ts)
+
+    start_ts = time.perf_counter()
+    await asyncio.gather(*(one_call() for _ in range(requests)))
+    elapsed = time.perf_counter() - start_ts
+    return {
+        "concurrency": concurrency,
+        "size": size,
+        "ops": len(latencies) / elapsed if elapsed else 0.0,
+        "errors": errors,
+        "latencies": latencies,
+    }
+
+
+def format_histogram(latencies: list[float], width: int = 40) -> str:
+    """以毫秒为单位的对数分桶直方图。"""
+    counts = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+    for latency in latencies:
+        ms = latency * 1000
+        bucket = next((i for i, edge in enumerate(HISTOGRAM_BUCKETS_MS) if ms < edge), len(HISTOGRAM_BUCKETS_MS))
+        counts[bucket] += 1
+    peak = max(counts) or 1
+    labels = [f"< {edge:g}ms" for edge in HISTOGRAM_BUCKETS_MS] + [f">= {HISTOGRAM_BUCKETS_MS[-1]:g}ms"]
+    return "\n".join(
+        f"    {label:>10} | {'█' * round(count / peak * width):<{width}} {count}"
+        for label, count in zip(labels, counts)
+        if count
+    )
+
+
+async def benchmark_transport(
+    transport: str, concurrencies: list[int], sizes: list[int], requests: int, show_histogram: bool
+) -> list[dict[str, Any]]:
+    print(f"\n## {transport}")
+    rows = []
+    async with BenchmarkServer(transport) as server:
+        async with server.connect() as connection:
+            await connection.call_tool("echo", {"text": "warmup"})
+            for size in sizes:
+                for concurrency in concurrencies:
+                    row = await run_case(connection, concurrency, size, requests)
+                    row["transport"] = transport
+                    rows.append(row)
+                    lat = row["latencies"]
+                    print(
+                        f"  负载 {size:>8}B  并发 {concurrency:>3}  "
+                        f"{row['ops']:>9.1f} ops/s  "
+                        f"p50 {percentile(lat, 50) * 1000:7.2f}ms  "
+                        f"p90 {percentile(lat, 90) * 1000:7.2f}ms  "
+                        f"p99 {percentile(lat, 99) * 1000:7.2f}ms  "
+                        f"错误 {row['errors']}"
+                    )
+                    if show_histogram and lat:
+                        print(format_histogram(lat))
+    return rows
+
+
+async def run_benchmarks(args: argparse.Namespace):
+    print("# MCP 传输基准测试")
+    summary = []
+    for transport in args.transports:
+        try:
+            summary.extend(
+                await benchmark_transport(transport, args.concurrency, args.sizes, args.requests, not args.no_histogram)
+            )
+        except Exception as e:
+            print(f"❌ {transport} 基准测试失败：{e}")
+
+    print("\n## 汇总（每种负载大小下的最高吞吐量）\n")
+    print("| 传输 | 负载 (B) | 最佳并发 | ops/s | p99 (ms) |")
+    print("|---|---|---|---|---|")
+    for transport in args.transports:
+        for size in args.sizes:
+            rows = [r for r in summary if r["transport"] == transport and r["size"] == size]
+            if rows:
+                best = max(rows, key=lambda r: r["ops"])
+                print(
+                    f"| {transport} | {size} | {best['concurrency']} | {best['ops']:.1f} "
+                    f"| {percentile(best['latencies'], 99) * 1000:.2f} |"
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量 MCP 传输的调用延迟、吞吐量和负载上限")
+    parser.add_argument("-t", "--transports", nargs="+", choices=["stdio", "sse", "http"], default=["stdio", "sse", "http"])
+    parser.add_argument("-c", "--concurrency", nargs="+", type=int, default=[1, 4, 16, 64], help="并发数列表")
+    parser.add_argument("-s", "--sizes", nargs="+", type=int, default=[64, 4096, 65536, 1048576], help="负载字节数列表")
+    parser.add_argument("-n", "--requests", type=int, default=200, help="每种组合的调用次数（默认：200）")
+    parser.add_argument("--no-histogram", action="store_true", help="不打印延迟直方图")
+    parser.add_argument("--serve", choices=["stdio", "sse", "http"], help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=8000, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        # 服务器由 FastMCP 管理自己的事件循环
+        serve(args.serve, args.port)
+    else:
+        asyncio.run(run_benchmarks(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""评估运行的录制与回放。
+
+录制模式把模型响应和 MCP 工具结果（连同各自的耗时）写入 cassette 文件；
+回放模式用本地替身代替模型 API 和 MCP 服务器，按录制内容确定性地返回结果，
+从而在没有网络的环境中测量评估框架自身的开销和并发扩展性。
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any
+
+from anthropic.types import Message
+
+from tool_cache import ToolResultCache, to_jsonable
+
+
+def _plain_text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content or [] if isinstance(block, dict))
+
+
+def model_request_key(kwargs: dict[str, Any]) -> str:
+    """根据模型、系统提示、首条用户问题和轮次生成模型请求的键。
+
+    同一任务的同一轮次在录制和回放时总是得到相同的键，不受提示缓存标记、
+    工具耗时等非确定性因素影响。
+    """
+    messages = kwargs["messages"]
+    question = _plain_text(messages[0]["content"])
+    system = _plain_text(kwargs.get("system"))
+    turn = sum(1 for m in messages if m["role"] == "assistant")
+    digest = hashlib.sha1(f"{kwargs['model']}\0{system}\0{question}".encode("utf-8")).hexdigest()[:16]
+    return f"{digest}:{turn}"
+
+
+class Cassette:
+    """保存录制内容的 JSON 文件。"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.tools: list[dict[str, Any]] | None = None
+        self.model: dict[str, dict[str, Any]] = {}
+        self.tool_results: dict[str, dict[str, Any]] = {}
+
+    @classmethod
+    def load(cls, path: Path) -> "Cassette":
+        cassette = cls(path)
+        data = json.loads(cassette.path.read_text(encoding="utf-8"))
+        cassette.tools = data.get("tools")
+        cassette.model = data.get("model", {})
+        cassette.tool_results = data.get("tool_results", {})
+        return cassette
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp_path.write_text(
+            json.dumps(
+                {"tools": self.tools, "model": self.model, "tool_results": self.tool_results},
+                ensure_ascii=False,
+            ),
+            encoding="utf-8",
+        )
+        os.replace(tmp_path, self.path)
+
+
+class _RecordingMessages:
+    def __init__(self, messages: Any, cassette: Cassette):
+        self._messages = messages
+        self._cassette = cassette
+
+    async def create(self, **kwargs) -> Any:
+        start_ts = time.time()
+        response = await self._messages.create(**kwargs)
+        self._cassette.model[model_request_key(kwargs)] = {
+            "duration": time.time() - start_ts,
+            "response": response.model_dump(mode="json"),
+        }
+        return response
+
+
+class RecordingAnthropic:
+    """包装 AsyncAnthropic，把每个模型响应写入 cassette。"""
+
+    def __init__(self, client: Any, cassette: Cassette):
+        self._client = client
+        self.messages = _RecordingMessages(client.messages, cassette)
+
+    async def close(self):
+        await self._client.close()
+
+
+class _ReplayMessages:
+    def __init__(self, cassette: Cassette, latency_scale: float):
+        self._cassette = cassette
+        self._latency_scale = latency_scale
+
+    async def create(self, **kwargs) -> Any:
+        key = model_request_key(kwargs)
+        entry = self._cassette.model.get(key)
+        if entry is None:
+            raise KeyError(f"cassette 中没有匹配的模型响应：{key}")
+        if self._latency_scale:
+            await asyncio.sleep(entry["duration"] * self._latency_scale)
+        return Message.model_validate(entry["response"])
+
+
+class ReplayAnthropic:
+    """从 cassette 回放模型响应的本地替身，不访问网络。
+
+    latency_scale 为 0 时立即返回（只测量框架开销），为 1 时按录制时的耗时等待。
+    """
+
+    def __init__(self, cassette: Cassette, latency_scale: float = 0.0):
+        self.messages = _ReplayMessages(cassette, latency_scale)
+
+    async def close(self):
+        pass
+
+
+class RecordingConnection:
+    """包装 MCPConnection 或 MCPConnectionPool，录制工具目录和工具结果。
+
+    工具结果以可 JSON 序列化的形式返回，保证录制和回放时交给模型的内容一致。
+    """
+
+    def __init__(self, connection: Any, cassette: Cassette):
+        self._connection = connection
+        self._cassette = cassette
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._connection, name)
+
+    async def __aenter__(self):
+        await self._connection.__aenter__()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self._connection.__aexit__(exc_type, exc_val, exc_tb)
+
+    async def list_tools(self) -> list[dict[str, Any]]:
+        tools = await self._connection.list_tools()
+        self._cassette.tools = to_jsonable(tools)
+        return tools
+
+    async def call_tool(self, tool_name: str, arguments: dict[str, Any]) -> Any:
+        start_ts = time.time()
+        content = await self._connection.call_tool(tool_name, arguments)
+        self._cassette.tool_results[ToolResultCache.make_key(tool_name, arguments)] = {
+            "duration": time.time() - start_ts,
+            "content": to_jsonable(content),
+        }
+        return content
+
+
+class ReplayConnection:
+    """代替 MCP 服务器的本地替身，从 cassette 回放工具目录和工具结果。"""
+
+    def __init__(self, cassette: Cassette, latency_scale: float = 0.0):
+        self._cassette = cassette
+        self._latency_scale = latency_scale
+        self.cache = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    async def list_tools(self) -> list[dict[str, Any]]:
+        return self._cassette.tools or []
+
+    async def call_tool(self, tool_name: str, arguments: dict[str, Any]) -> Any:
+        key = ToolResultCache.make_key(tool_name, arguments)
+        entry = self._cassette.tool_results.get(key)
+        if entry is None:
+            raise KeyError(f"cassette 中没有匹配的工具结果：{key}")
+        if self._latency_scale:
+            await asyncio.sleep(entry["duration"] * self._latency_scale)
+        return entry["content"]
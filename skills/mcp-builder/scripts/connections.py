@@ -1,45 +1,178 @@
 """MCP 服务器的轻量级连接处理。"""
 
+import asyncio
+import contextvars
+import random
+import time
 from abc import ABC, abstractmethod
-from contextlib import AsyncExitStack
-from typing import Any
+from contextlib import AsyncExitStack, asynccontextmanager, suppress
+from functools import partial
+from typing import Any, AsyncIterator, Awaitable, Callable
 
-from mcp import ClientSession, StdioServerParameters
+import anyio
+from mcp import ClientSession, StdioServerParameters, types
 from mcp.client.sse import sse_client
 from mcp.client.stdio import stdio_client
 from mcp.client.streamable_http import streamablehttp_client
 
+from tracing import span
+
+
+# 视为瞬时故障、可以对幂等工具重试的异常
+RETRYABLE_ERRORS = (
+    asyncio.TimeoutError,  # Python 3.10 中 wait_for 抛出的超时与内置 TimeoutError 不是同一个类
+    OSError,
+    anyio.ClosedResourceError,
+    anyio.BrokenResourceError,
+    anyio.EndOfStream,
+)
+
+
+# 当前任务通过会话发出的请求 ID，超时或取消时据此通知服务器
+_request_ids: contextvars.ContextVar[list[Any] | None] = contextvars.ContextVar("mcp_request_ids", default=None)
+
+CANCEL_NOTIFY_TIMEOUT = 5.0
+
+
+class _TrackingClientSession(ClientSession):
+    """记录当前任务发出的请求 ID 的 ClientSession。
+
+    SDK 没有公开请求 ID；send_request 在第一次 await 之前读取并递增 _request_id，
+    因此在调用前读取的值就是这次请求的 ID。
+    """
+
+    async def send_request(self, request, *args, **kwargs):
+        request_ids = _request_ids.get()
+        if request_ids is not None and hasattr(self, "_request_id"):
+            request_ids.append(self._request_id)
+        return await super().send_request(request, *args, **kwargs)
+
+
+class ToolCallPolicy:
+    """工具调用的超时、重试和对冲策略。
+
+    参数：
+        timeout: 默认的单次调用超时（秒），None 表示不限制
+        tool_timeouts: 按工具名覆盖的超时
+        retries: 幂等工具在超时或连接错误后的最大重试次数
+        idempotent_tools: 允许重试和对冲的工具名；包含 "*" 时适用于所有工具
+        backoff_base: 退避的基准时长（秒），第 n 次重试前等待 [0, base * 2^n] 内的随机时长
+        backoff_max: 单次退避的上限（秒）
+        hedge_after: 幂等工具调用超过此时长（秒）仍未返回时，在另一个池化会话上
+            发出对冲请求，采用先返回的结果；None 表示不对冲
+    """
+
+    def __init__(
+        self,
+        timeout: float | None = None,
+        tool_timeouts: dict[str, float] | None = None,
+        retries: int = 0,
+        idempotent_tools: set[str] | list[str] = (),
+        backoff_base: float = 0.5,
+        backoff_max: float = 10.0,
+        hedge_after: float | None = None,
+    ):
+        self.timeout = timeout
+        self.tool_timeouts = tool_timeouts or {}
+        self.retries = retries
+        self.idempotent_tools = set(idempotent_tools)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+        self.timeouts = 0
+        self.retried = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def timeout_for(self, tool_name: str) -> float | None:
+        return self.tool_timeouts.get(tool_name, self.timeout)
+
+    def is_idempotent(self, tool_name: str) -> bool:
+        return "*" in self.idempotent_tools or tool_name in self.idempotent_tools
+
+    def hedge_delay(self, tool_name: str) -> float | None:
+        return self.hedge_after if self.is_idempotent(tool_name) else None
+
+    async def timed(self, tool_name: str, request: Awaitable[Any]) -> Any:
+        """在该工具的超时限制内等待 request。
+
+        超时会取消进行中的请求，会话随后向服务器发送 notifications/cancelled。
+        """
+        timeout = self.timeout_for(tool_name)
+        try:
+            return await asyncio.wait_for(request, timeout)
+        except asyncio.TimeoutError as e:
+            self.timeouts += 1
+            raise TimeoutError(f"工具 {tool_name} 调用超过 {timeout}s 未返回") from e
+
+    async def run(self, tool_name: str, attempt: Callable[[], Awaitable[Any]]) -> Any:
+        """执行 attempt，并按策略对幂等工具重试。
+
+        超时由 attempt 内部用 timed() 只施加在实际请求上，连接池中等待空闲会话的
+        时间不计入超时。
+        """
+        retries = self.retries if self.is_idempotent(tool_name) else 0
+        for attempt_no in range(retries + 1):
+            try:
+                return await attempt()
+            except RETRYABLE_ERRORS:
+                if attempt_no == retries:
+                    raise
+                self.retried += 1
+                await asyncio.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt_no)))
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "timeouts": self.timeouts,
+            "retries": self.retried,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+        }
+
 
 class MCPConnection(ABC):
     """MCP 服务器连接的基类。"""
 
     def __init__(self):
         self.session = None
+        self.cache = None
+        self.catalog = None
+        self.policy = None
+        self.server_info = None
         self._stack = None
+        self._background: set[asyncio.Task] = set()
 
     @abstractmethod
     def _create_context(self):
         """根据连接类型创建连接上下文。"""
 
+    @property
+    @abstractmethod
+    def server_key(self) -> str:
+        """标识所连接服务器的字符串，用作工具目录缓存的键。"""
+
     async def __aenter__(self):
         """初始化 MCP 服务器连接。"""
         self._stack = AsyncExitStack()
         await self._stack.__aenter__()
 
         try:
-            ctx = self._create_context()
-            result = await self._stack.enter_async_context(ctx)
-
-            if len(result) == 2:
-                read, write = result
-            elif len(result) == 3:
-                read, write, _ = result
-            else:
-                raise ValueError(f"意外的上下文结果：{result}")
-
-            session_ctx = ClientSession(read, write)
-            self.session = await self._stack.enter_async_context(session_ctx)
-            await self.session.initialize()
+            with span("mcp.connect", server=self.server_key):
+                ctx = self._create_context()
+                result = await self._stack.enter_async_context(ctx)
+
+                if len(result) == 2:
+                    read, write = result
+                elif len(result) == 3:
+                    read, write, _ = result
+                else:
+                    raise ValueError(f"意外的上下文结果：{result}")
+
+                session_ctx = _TrackingClientSession(read, write)
+                self.session = await self._stack.enter_async_context(session_ctx)
+                with span("mcp.initialize"):
+                    init_result = await self.session.initialize()
+                self.server_info = getattr(init_result, "serverInfo", None)
             return self
         except BaseException:
             await self._stack.__aexit__(None, None, None)
@@ -52,8 +185,23 @@ class MCPConnection(ABC):
         self.session = None
         self._stack = None
 
+    @property
+    def server_fingerprint(self) -> str | None:
+        """服务器在 initialize 时报告的名称和版本，用于廉价地校验工具目录缓存。"""
+        if self.server_info is None:
+            return None
+        return f"{self.server_info.name}@{self.server_info.version}"
+
     async def list_tools(self) -> list[dict[str, Any]]:
         """从 MCP 服务器检索可用工具。"""
+        with span("mcp.list_tools", server=self.server_key):
+            if self.catalog is not None:
+                return await self.catalog.get_or_fetch(
+                    self.server_key, self.server_fingerprint, self._list_tools
+                )
+            return await self._list_tools()
+
+    async def _list_tools(self) -> list[dict[str, Any]]:
         response = await self.session.list_tools()
         return [
             {
@@ -66,8 +214,53 @@ class MCPConnection(ABC):
 
     async def call_tool(self, tool_name: str, arguments: dict[str, Any]) -> Any:
         """使用提供的参数调用 MCP 服务器上的工具。"""
-        result = await self.session.call_tool(tool_name, arguments=arguments)
-        return result.content
+        with span("mcp.call_tool", tool=tool_name):
+            if self.cache is not None:
+                return await self.cache.call(tool_name, arguments, self._call_tool)
+            result = await self._call_tool(tool_name, arguments)
+            return result.content
+
+    async def _call_tool(self, tool_name: str, arguments: dict[str, Any]) -> Any:
+        if self.policy is not None:
+            return await self.policy.run(
+                tool_name, lambda: self.policy.timed(tool_name, self._session_call(tool_name, arguments))
+            )
+        return await self._session_call(tool_name, arguments)
+
+    async def _session_call(self, tool_name: str, arguments: dict[str, Any]) -> Any:
+        request_ids: list[Any] = []
+        token = _request_ids.set(request_ids)
+        try:
+            # 每次实际发往服务器的请求（含重试和对冲）各记录一个 span
+            with span("mcp.request", tool=tool_name):
+                return await self.session.call_tool(tool_name, arguments=arguments)
+        except asyncio.CancelledError:
+            # 超时或对冲落败：通知服务器停止处理这个请求，以免它继续占用会话
+            if request_ids:
+                self._notify_cancelled(request_ids[-1])
+            raise
+        finally:
+            _request_ids.reset(token)
+
+    def _notify_cancelled(self, request_id: Any):
+        session = self.session
+        if session is None:
+            return
+        notification = types.ClientNotification(
+            types.CancelledNotification(
+                params=types.CancelledNotificationParams(requestId=request_id, reason="客户端超时或已取消")
+            )
+        )
+
+        async def send():
+            # 尽力而为：会话已经断开时忽略
+            with suppress(Exception):
+                await asyncio.wait_for(session.send_notification(notification), CANCEL_NOTIFY_TIMEOUT)
+
+        # 调用方正在被取消，通知在独立的任务中发送
+        task = asyncio.create_task(send())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
 
 
 class MCPConnectionStdio(MCPConnection):
@@ -84,6 +277,10 @@ class MCPConnectionStdio(MCPConnection):
             StdioServerParameters(command=self.command, args=self.args, env=self.env)
         )
 
+    @property
+    def server_key(self) -> str:
+        return "stdio:" + " ".join([self.command, *self.args])
+
 
 class MCPConnectionSSE(MCPConnection):
     """使用服务器发送事件的 MCP 连接。"""
@@ -96,6 +293,10 @@ class MCPConnectionSSE(MCPConnection):
     def _create_context(self):
         return sse_client(url=self.url, headers=self.headers)
 
+    @property
+    def server_key(self) -> str:
+        return f"sse:{self.url}"
+
 
 class MCPConnectionHTTP(MCPConnection):
     """使用可流式 HTTP 的 MCP 连接。"""
@@ -108,6 +309,215 @@ class MCPConnectionHTTP(MCPConnection):
     def _create_context(self):
         return streamablehttp_client(url=self.url, headers=self.headers)
 
+    @property
+    def server_key(self) -> str:
+        return f"http:{self.url}"
+
+
+class _PooledSession:
+    """连接池中的单个会话。
+
+    anyio 要求传输上下文在进入它的同一任务中退出，因此每个会话都由一个
+    专属的后台任务持有，直到连接池要求它关闭。
+    """
+
+    def __init__(self, connection: MCPConnection):
+        self.connection = connection
+        self.last_checked = 0.0
+        self._stop = asyncio.Event()
+        self._task = None
+
+    async def start(self):
+        ready = asyncio.get_running_loop().create_future()
+
+        async def hold():
+            try:
+                async with self.connection:
+                    ready.set_result(None)
+                    await self._stop.wait()
+            except BaseException as e:
+                if not ready.done():
+                    ready.set_exception(e)
+
+        self._task = asyncio.create_task(hold())
+        await ready
+        self.last_checked = time.monotonic()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task:
+            with suppress(BaseException):
+                await self._task
+
+
+class MCPConnectionPool:
+    """由多个 MCP 会话组成的连接池。
+
+    会话通过 factory 创建（任意传输类型），并以租借方式分配给并发调用方。
+    闲置超过 health_check_interval 或上次使用时出错的会话会在租借前被 ping，
+    失效的会话会被关闭并替换。连接池提供与 MCPConnection 相同的
+    list_tools/call_tool 接口，可直接替换单个连接使用。
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], MCPConnection],
+        size: int = 4,
+        health_check_interval: float = 30.0,
+        health_check_timeout: float = 5.0,
+        cache: Any = None,
+        policy: ToolCallPolicy | None = None,
+    ):
+        if size < 1:
+            raise ValueError("连接池大小必须至少为 1")
+        self.factory = factory
+        self.size = size
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self.cache = cache
+        self.policy = policy
+        self.replaced = 0
+        self._sessions: list[_PooledSession] = []
+        self._idle: asyncio.Queue[_PooledSession] | None = None
+
+    async def __aenter__(self):
+        """并发打开全部会话。"""
+        self._idle = asyncio.Queue()
+        results = await asyncio.gather(
+            *(self._open() for _ in range(self.size)), return_exceptions=True
+        )
+        errors = [r for r in results if isinstance(r, BaseException)]
+        for r in results:
+            if not isinstance(r, BaseException):
+                self._sessions.append(r)
+                self._idle.put_nowait(r)
+        if errors:
+            await self.__aexit__(None, None, None)
+            raise errors[0]
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """关闭连接池中的全部会话。"""
+        sessions, self._sessions = self._sessions, []
+        await asyncio.gather(*(s.stop() for s in sessions))
+        self._idle = None
+
+    async def _open(self) -> _PooledSession:
+        pooled = _PooledSession(self.factory())
+        await pooled.start()
+        return pooled
+
+    async def _is_healthy(self, pooled: _PooledSession) -> bool:
+        session = pooled.connection.session
+        if session is None or pooled._task.done():
+            return False
+        try:
+            await asyncio.wait_for(session.send_ping(), self.health_check_timeout)
+        except Exception:
+            return False
+        pooled.last_checked = time.monotonic()
+        return True
+
+    async def _replace(self, pooled: _PooledSession) -> _PooledSession:
+        await pooled.stop()
+        fresh = await self._open()
+        self._sessions[self._sessions.index(pooled)] = fresh
+        self.replaced += 1
+        return fresh
+
+    @asynccontextmanager
+    async def lease(self) -> AsyncIterator[MCPConnection]:
+        """从连接池中租借一个健康的连接，用完后自动归还。"""
+        if self._idle is None:
+            raise RuntimeError("连接池尚未打开")
+        with span("mcp.pool.lease"):
+            pooled = await self._idle.get()
+            try:
+                if time.monotonic() - pooled.last_checked > self.health_check_interval:
+                    if not await self._is_healthy(pooled):
+                        pooled = await self._replace(pooled)
+            except BaseException:
+                # 替换失败：归还旧会话并标记为待检查，避免连接池缩小
+                pooled.last_checked = 0.0
+                self._idle.put_nowait(pooled)
+                raise
+
+        try:
+            yield pooled.connection
+        except BaseException:
+            # 出错或被取消（超时、对冲落败）的会话在下次租借前先做健康检查
+            pooled.last_checked = 0.0
+            raise
+        finally:
+            self._idle.put_nowait(pooled)
+
+    async def list_tools(self) -> list[dict[str, Any]]:
+        """通过任意一个池化会话检索可用工具。"""
+        async with self.lease() as connection:
+            return await connection.list_tools()
+
+    async def call_tool(self, tool_name: str, arguments: dict[str, Any]) -> Any:
+        """租借一个会话并调用工具。"""
+        with span("mcp.call_tool", tool=tool_name):
+            if self.cache is not None:
+                return await self.cache.call(tool_name, arguments, self._call_tool)
+            result = await self._call_tool(tool_name, arguments)
+            return result.content
+
+    async def _call_tool(self, tool_name: str, arguments: dict[str, Any]) -> Any:
+        if self.policy is not None:
+            return await self.policy.run(tool_name, lambda: self._hedged_call(tool_name, arguments))
+        return await self._leased_call(tool_name, arguments)
+
+    async def _leased_call(
+        self, tool_name: str, arguments: dict[str, Any], leased: asyncio.Event | None = None
+    ) -> Any:
+        """租借会话后发出请求；超时只从拿到会话开始计算。"""
+        async with self.lease() as connection:
+            if leased is not None:
+                leased.set()
+            request = connection._session_call(tool_name, arguments)
+            if self.policy is not None:
+                return await self.policy.timed(tool_name, request)
+            return await request
+
+    async def _hedged_call(self, tool_name: str, arguments: dict[str, Any]) -> Any:
+        """主请求拿到会话后超过 hedge_after 未返回时，在另一个会话上发出对冲请求。"""
+        hedge_after = self.policy.hedge_delay(tool_name)
+        if hedge_after is None or self.size < 2:
+            return await self._leased_call(tool_name, arguments)
+
+        leased = asyncio.Event()
+        primary = asyncio.create_task(self._leased_call(tool_name, arguments, leased))
+        backup = None
+        try:
+            # 等待空闲会话的时间不计入对冲延迟
+            lease_wait = asyncio.create_task(leased.wait())
+            try:
+                await asyncio.wait({primary, lease_wait}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                lease_wait.cancel()
+            done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+            if done:
+                return primary.result()
+
+            self.policy.hedged += 1
+            backup = asyncio.create_task(self._leased_call(tool_name, arguments))
+            pending = {primary, backup}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            self.policy.hedge_wins += 1
+                        return task.result()
+            # 两个请求都失败：抛出主请求的错误
+            raise primary.exception()
+        finally:
+            for task in (primary, backup):
+                if task is not None and not task.done():
+                    task.cancel()
+
 
 def create_connection(
     transport: str,
@@ -116,6 +526,9 @@ def create_connection(
     env: dict[str, str] = None,
     url: str = None,
     headers: dict[str, str] = None,
+    cache: Any = None,
+    catalog: Any = None,
+    policy: ToolCallPolicy | None = None,
 ) -> MCPConnection:
     """创建适当 MCP 连接的工厂函数。
 
@@ -126,6 +539,9 @@ def create_connection(
         env: 环境变量（仅 stdio）
         url: 服务器 URL（仅 sse 和 http）
         headers: HTTP 头（仅 sse 和 http）
+        cache: 可选的 ToolResultCache，用于缓存只读工具的结果
+        catalog: 可选的 ToolCatalogCache，用于跨会话和运行复用工具目录
+        policy: 可选的 ToolCallPolicy，为工具调用设置超时和重试
 
     返回：
         MCPConnection 实例
@@ -135,17 +551,41 @@ def create_connection(
     if transport == "stdio":
         if not command:
             raise ValueError("stdio 传输需要 command")
-        return MCPConnectionStdio(command=command, args=args, env=env)
+        connection = MCPConnectionStdio(command=command, args=args, env=env)
 
     elif transport == "sse":
         if not url:
             raise ValueError("sse 传输需要 URL")
-        return MCPConnectionSSE(url=url, headers=headers)
+        connection = MCPConnectionSSE(url=url, headers=headers)
 
     elif transport in ["http", "streamable_http", "streamable-http"]:
         if not url:
             raise ValueError("http 传输需要 URL")
-        return MCPConnectionHTTP(url=url, headers=headers)
+        connection = MCPConnectionHTTP(url=url, headers=headers)
 
     else:
         raise ValueError(f"不支持的传输类型：{transport}。使用 'stdio'、'sse' 或 'http'")
+
+    connection.cache = cache
+    connection.catalog = catalog
+    connection.policy = policy
+    return connection
+
+
+def create_connection_pool(
+    transport: str,
+    size: int = 4,
+    cache: Any = None,
+    policy: ToolCallPolicy | None = None,
+    **kwargs,
+) -> MCPConnectionPool:
+    """创建由 size 个相同配置的会话组成的 MCPConnectionPool。
+
+    kwargs 与 create_connection 的参数相同，并会先校验一次。cache 和 policy
+    作用于整个连接池（对冲请求需要在多个会话之间进行），而不是挂在单个会话上；
+    kwargs 中的 catalog 则传给每个会话，因此所有会话共用同一份工具目录。
+    """
+    create_connection(transport, **kwargs)
+    return MCPConnectionPool(
+        partial(create_connection, transport, **kwargs), size=size, cache=cache, policy=policy
+    )
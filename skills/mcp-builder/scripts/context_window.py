@@ -0,0 +1,105 @@
+"""agent_loop 对话上下文的大小控制。
+
+长任务会不断把助手回合和完整的工具结果追加到 messages 中，每一轮请求都越来越大。
+ContextWindow 对单个工具结果设置硬上限（保留首尾、省略中间），并在估算的提示
+令牌数超过预算时，从最旧的工具结果开始把内容替换为简短的占位说明。
+"""
+
+import json
+from typing import Any
+
+from tool_cache import to_jsonable
+
+ELIDED_PREFIX = "[为控制上下文长度，已省略较早的工具结果"
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算令牌数：按 UTF-8 字节数 / 4，对中文等多字节文本也偏保守。"""
+    return (len(text.encode("utf-8")) + 3) // 4
+
+
+def _block_text(block: Any) -> str:
+    if isinstance(block, dict):
+        content = block.get("content", block.get("text", ""))
+        return content if isinstance(content, str) else json.dumps(to_jsonable(content), ensure_ascii=False)
+    text = getattr(block, "text", None)
+    if text is not None:
+        return text
+    return json.dumps(to_jsonable(block), ensure_ascii=False, default=str)
+
+
+def estimate_message_tokens(messages: list[dict[str, Any]]) -> int:
+    total = 0
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            total += estimate_tokens(content)
+        else:
+            total += sum(estimate_tokens(_block_text(block)) for block in content)
+    return total
+
+
+class ContextWindow:
+    """限制工具结果大小和对话总长度。
+
+    参数：
+        max_tool_result_chars: 单个工具结果的字符上限，超出部分从中间省略
+        max_context_tokens: 对话的估算令牌预算，超出时省略较早的工具结果
+        keep_recent_turns: 始终保留原文的最近工具结果轮数
+    """
+
+    def __init__(
+        self,
+        max_tool_result_chars: int = 50000,
+        max_context_tokens: int = 150000,
+        keep_recent_turns: int = 1,
+    ):
+        self.max_tool_result_chars = max_tool_result_chars
+        self.max_context_tokens = max_context_tokens
+        self.keep_recent_turns = keep_recent_turns
+        self.truncated = 0
+        self.elided = 0
+
+    def cap_tool_result(self, text: str) -> str:
+        """超过上限的工具结果只保留开头和结尾。"""
+        if len(text) <= self.max_tool_result_chars:
+            return text
+        self.truncated += 1
+        keep = self.max_tool_result_chars // 2
+        omitted = len(text) - 2 * keep
+        # keep 可能为 0，text[-0:] 会是整个字符串
+        return f"{text[:keep]}\n…[已省略 {omitted} 个字符]…\n{text[len(text) - keep:]}"
+
+    def fit(self, messages: list[dict[str, Any]]) -> int:
+        """就地省略最旧的工具结果，直到估算的令牌数不超过预算。
+
+        返回调整后的估算令牌数。
+        """
+        tokens = estimate_message_tokens(messages)
+        if tokens <= self.max_context_tokens:
+            return tokens
+
+        tool_turns = [
+            m for m in messages
+            if m["role"] == "user" and isinstance(m["content"], list)
+            and any(isinstance(b, dict) and b.get("type") == "tool_result" for b in m["content"])
+        ]
+        for message in tool_turns[: max(0, len(tool_turns) - self.keep_recent_turns)]:
+            for block in message["content"]:
+                content = block.get("content")
+                if (
+                    block.get("type") != "tool_result"
+                    or not isinstance(content, str)
+                    or content.startswith(ELIDED_PREFIX)
+                ):
+                    continue
+                placeholder = f"{ELIDED_PREFIX}（{len(content)} 个字符）]"
+                tokens -= estimate_tokens(content) - estimate_tokens(placeholder)
+                block["content"] = placeholder
+                self.elided += 1
+                if tokens <= self.max_context_tokens:
+                    return tokens
+        return tokens
+
+    def stats(self) -> dict[str, int]:
+        return {"truncated": self.truncated, "elided": self.elided}
@@ -5,6 +5,9 @@
 
 import argparse
 import asyncio
+import csv
+import hashlib
+import itertools
 import json
 import re
 import sys
@@ -12,11 +15,18 @@ import time
 import traceback
 import xml.etree.ElementTree as ET
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable, Iterator
 
-from anthropic import Anthropic
+from anthropic import AsyncAnthropic
 
-from connections import create_connection
+from cassette import Cassette, RecordingAnthropic, RecordingConnection, ReplayAnthropic, ReplayConnection
+from connections import ToolCallPolicy, create_connection, create_connection_pool
+from context_window import ContextWindow
+from rate_limit import RateLimitScheduler
+from report import ReportWriter, render_matrix, render_report, render_summary
+from scoring import resolve_scorer, try_score_answer
+from tool_cache import ToolCatalogCache, ToolResultCache, to_jsonable
+from tracing import Tracer, set_tracer, span
 
 EVALUATION_PROMPT = """你是一个可以访问工具的 AI 助手。
 
@@ -53,27 +63,141 @@ EVALUATION_PROMPT = """你是一个可以访问工具的 AI 助手。
 - 你的响应应该放在最后"""
 
 
-def parse_evaluation_file(file_path: Path) -> list[dict[str, Any]]:
-    """解析带有 qa_pair 元素的 XML 评估文件。"""
+def _iter_xml(file_path: Path) -> Iterator[dict[str, Any]]:
+    """用 iterparse 流式读取 XML 中的 qa_pair，读完即释放元素。"""
+    for _, elem in ET.iterparse(file_path, events=("end",)):
+        if elem.tag != "qa_pair":
+            continue
+        question_elem = elem.find("question")
+        answer_elem = elem.find("answer")
+        if question_elem is not None and answer_elem is not None:
+            qa_pair = {
+                "question": (question_elem.text or "").strip(),
+                "answer": (answer_elem.text or "").strip(),
+            }
+            scorer = elem.get("scorer") or elem.findtext("scorer")
+            if scorer:
+                qa_pair["scorer"] = scorer.strip()
+            yield qa_pair
+        elem.clear()
+
+
+def _iter_jsonl(file_path: Path) -> Iterator[dict[str, Any]]:
+    with file_path.open(encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if line.strip():
+                try:
+                    record = json.loads(line)
+                    qa_pair = {"question": str(record["question"]).strip(), "answer": str(record["answer"]).strip()}
+                except (ValueError, KeyError, TypeError) as e:
+                    raise ValueError(f"第 {line_no} 行无效（{type(e).__name__}: {e}）") from None
+                if record.get("scorer"):
+                    qa_pair["scorer"] = str(record["scorer"]).strip()
+                yield qa_pair
+
+
+def _iter_csv(file_path: Path) -> Iterator[dict[str, Any]]:
+    with file_path.open(encoding="utf-8", newline="") as f:
+        reader = csv.DictReader(f)
+        missing = {"question", "answer"} - set(reader.fieldnames or [])
+        if missing:
+            raise ValueError(f"CSV 缺少列：{', '.join(sorted(missing))}")
+        for row in reader:
+            qa_pair = {"question": (row["question"] or "").strip(), "answer": (row["answer"] or "").strip()}
+            if row.get("scorer"):
+                qa_pair["scorer"] = row["scorer"].strip()
+            yield qa_pair
+
+
+EVALUATION_READERS = {
+    ".xml": _iter_xml,
+    ".jsonl": _iter_jsonl,
+    ".csv": _iter_csv,
+}
+
+
+def parse_shard(value: str) -> tuple[int, int]:
+    """解析 "i/n" 形式的分片参数（i 从 1 开始），返回从 0 开始的 (i, n)。"""
     try:
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-        evaluations = []
-
-        for qa_pair in root.findall(".//qa_pair"):
-            question_elem = qa_pair.find("question")
-            answer_elem = qa_pair.find("answer")
-
-            if question_elem is not None and answer_elem is not None:
-                evaluations.append({
-                    "question": (question_elem.text or "").strip(),
-                    "answer": (answer_elem.text or "").strip(),
-                })
-
-        return evaluations
-    except Exception as e:
-        print(f"解析评估文件 {file_path} 时出错：{e}")
-        return []
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"分片格式应为 i/n：{value}") from None
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"分片序号必须在 1 到 {count} 之间：{value}")
+    return index - 1, count
+
+
+def iter_evaluation_file(
+    file_path: Path, shard: tuple[int, int] | None = None
+) -> Iterator[dict[str, Any]]:
+    """按需逐个产出评估任务，支持 XML、JSONL（每行一个 question/answer 对象）和
+    CSV（question、answer 列）。任务可以带有可选的 scorer（XML 中为 qa_pair 的
+    scorer 属性或 <scorer> 子元素，JSONL/CSV 中为 scorer 字段）。
+
+    每个任务带有其在整个评估文件中的 index；提供 shard=(i, n) 时只产出
+    index % n == i 的任务，多台机器可以各取一片。
+    """
+    reader = EVALUATION_READERS.get(file_path.suffix.lower(), _iter_xml)
+    # 同一问题和答案的第 k 次重复（k > 0）记为 occurrence，使重复任务的 ID 互不相同；
+    # 在分片之前统计，各分片得到的 ID 一致
+    seen: dict[str, int] = {}
+    for index, qa_pair in enumerate(reader(file_path)):
+        base_id = task_id(qa_pair)
+        occurrence = seen.get(base_id, 0)
+        seen[base_id] = occurrence + 1
+        if occurrence:
+            qa_pair["occurrence"] = occurrence
+        if shard is None or index % shard[1] == shard[0]:
+            yield {"index": index, **qa_pair}
+
+
+def task_id(qa_pair: dict[str, Any]) -> str:
+    """根据问题和答案生成稳定的任务 ID，评估文件重新排序后依然有效。
+
+    重复的任务按出现次序（occurrence）区分，第一次出现的任务 ID 不受影响。
+    """
+    key = f"{qa_pair['question']}\0{qa_pair['answer']}"
+    if qa_pair.get("occurrence"):
+        key += f"\0{qa_pair['occurrence']}"
+    digest = hashlib.sha1(key.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def load_checkpoint(checkpoint_path: Path) -> dict[str, dict[str, Any]]:
+    """读取 JSONL 检查点，返回按任务 ID 索引的已完成结果。
+
+    中断时可能写了一半的最后一行会被忽略。
+    """
+    completed = {}
+    if not checkpoint_path.exists():
+        return completed
+    with checkpoint_path.open(encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            completed[record["task_id"]] = record
+    return completed
+
+
+def repair_checkpoint_tail(checkpoint_path: Path):
+    """续跑前修复检查点末尾：截掉中断时写了一半的最后一行，完整但缺少换行的
+    最后一行补上换行，避免新记录追加到同一行而无法解析。
+    """
+    if not checkpoint_path.exists():
+        return
+    with checkpoint_path.open("r+b") as f:
+        data = f.read()
+        if not data or data.endswith(b"\n"):
+            return
+        tail_start = data.rfind(b"\n") + 1
+        try:
+            json.loads(data[tail_start:])
+        except ValueError:
+            f.truncate(tail_start)
+        else:
+            f.write(b"\n")
 
 
 def extract_xml_content(text: str, tag: str) -> str | None:
@@ -83,137 +207,571 @@ def extract_xml_content(text: str, tag: str) -> str | None:
     return matches[-1].strip() if matches else None
 
 
+class IncompleteEvaluationError(Exception):
+    """评估文件读取出错，只运行了出错前的任务；report 是据此生成的（不完整）报告。"""
+
+    def __init__(self, message: str, report: str):
+        super().__init__(message)
+        self.report = report
+
+
+class ModelClient:
+    """共享单个连接池的异步模型客户端。
+
+    所有并发任务复用同一个 AsyncAnthropic 实例，请求由 RateLimitScheduler 调度：
+    max_in_flight 是同时进行中请求数的上限，遇到限速时自动降低并发并退避重试。
+    限速和瞬时错误（连接错误、408/409/5xx）的重试由调度器统一处理，因此自行创建的
+    AsyncAnthropic 关闭了 SDK 自带的重试。
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 32,
+        client: AsyncAnthropic | None = None,
+        scheduler: RateLimitScheduler | None = None,
+    ):
+        self.client = client or AsyncAnthropic(max_retries=0)
+        self.scheduler = scheduler or RateLimitScheduler(max_in_flight)
+
+    async def _send(self, kwargs: dict[str, Any]) -> tuple[Any, Any]:
+        # 录制/回放替身没有 with_raw_response，此时拿不到限速响应头
+        raw_messages = getattr(self.client.messages, "with_raw_response", None)
+        with span("model.request", model=kwargs.get("model")):
+            if raw_messages is None:
+                return await self.client.messages.create(**kwargs), None
+            raw = await raw_messages.create(**kwargs)
+            return await raw.parse(), raw.headers
+
+    async def create(self, priority: float | None = None, **kwargs) -> Any:
+        """经调度器发送一次 messages.create 请求；priority 越小越先获得并发槽位。
+
+        model.call span 包含在调度器中排队和限速等待的时间，model.request 只包含请求本身。
+        """
+        with span("model.call", model=kwargs.get("model")) as call_span:
+            response = await self.scheduler.run(lambda: self._send(kwargs), priority)
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                call_span.set_attribute("input_tokens", getattr(usage, "input_tokens", 0) or 0)
+                call_span.set_attribute("output_tokens", getattr(usage, "output_tokens", 0) or 0)
+            return response
+
+    async def close(self):
+        await self.client.close()
+
+
+async def execute_tool(connection: Any, tool_use: Any) -> tuple[str, float]:
+    """执行单个 tool_use 块，返回工具响应文本和耗时。"""
+    tool_start_ts = time.time()
+    try:
+        tool_result = await connection.call_tool(tool_use.name, tool_use.input)
+        # 直接调用、缓存和录制返回的结果统一在这里转换，模型看到的内容与路径无关
+        tool_response = (
+            json.dumps(to_jsonable(tool_result)) if isinstance(tool_result, (dict, list)) else str(tool_result)
+        )
+    except Exception as e:
+        tool_response = f"执行工具 {tool_use.name} 时出错：{str(e)}\n"
+        tool_response += traceback.format_exc()
+    return tool_response, time.time() - tool_start_ts
+
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def with_cache_breakpoint(messages: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """返回在最后一条消息上标记了缓存断点的消息副本。
+
+    只标记最新的消息，使之前的整段对话成为可复用的缓存前缀，同时保证断点
+    数量不超过 API 的上限；原始 messages 不会被修改。
+    """
+    last = messages[-1]
+    content = last["content"]
+    if isinstance(content, str):
+        blocks = [{"type": "text", "text": content}]
+    else:
+        blocks = list(content)
+    blocks[-1] = {**blocks[-1], "cache_control": CACHE_CONTROL}
+    return messages[:-1] + [{**last, "content": blocks}]
+
+
 async def agent_loop(
-    client: Anthropic,
+    client: ModelClient,
     model: str,
     question: str,
     tools: list[dict[str, Any]],
     connection: Any,
-) -> tuple[str, dict[str, Any]]:
-    """使用 MCP 工具运行代理循环。"""
+    prompt_cache: bool = False,
+    context: ContextWindow | None = None,
+    system_prompt: str = EVALUATION_PROMPT,
+) -> tuple[str, dict[str, Any], dict[str, Any]]:
+    """使用 MCP 工具运行代理循环。
+
+    prompt_cache 为 True 时，系统提示、工具定义和对话前缀会被标记为可缓存，
+    多轮任务从第二轮起只需为新增内容付费。提供 context 时，每个工具结果受长度
+    上限约束，对话超出令牌预算时省略较早的工具结果。返回最终响应文本、按工具
+    统计的调用耗时，以及模型调用的耗时、令牌用量（含缓存读写令牌）和每轮的
+    提示大小。
+    """
     messages = [{"role": "user", "content": question}]
-
-    response = await asyncio.to_thread(
-        client.messages.create,
-        model=model,
-        max_tokens=4096,
-        system=EVALUATION_PROMPT,
-        messages=messages,
-        tools=tools,
-    )
-
-    messages.append({"role": "assistant", "content": response.content})
+    # 同一任务的各轮请求使用任务开始时间作为调度优先级，先开始的任务先完成
+    priority = time.monotonic()
     tool_metrics = {}
-
-    while response.stop_reason == "tool_use":
-        tool_use = next(block for block in response.content if block.type == "tool_use")
-        tool_name = tool_use.name
-        tool_input = tool_use.input
-
-        tool_start_ts = time.time()
-        try:
-            tool_result = await connection.call_tool(tool_name, tool_input)
-            tool_response = json.dumps(tool_result) if isinstance(tool_result, (dict, list)) else str(tool_result)
-        except Exception as e:
-            tool_response = f"执行工具 {tool_name} 时出错：{str(e)}\n"
-            tool_response += traceback.format_exc()
-        tool_duration = time.time() - tool_start_ts
-
-        if tool_name not in tool_metrics:
-            tool_metrics[tool_name] = {"count": 0, "durations": []}
-        tool_metrics[tool_name]["count"] += 1
-        tool_metrics[tool_name]["durations"].append(tool_duration)
-
-        messages.append({
-            "role": "user",
-            "content": [{
-                "type": "tool_result",
-                "tool_use_id": tool_use.id,
-                "content": tool_response,
-            }]
-        })
-
-        response = await asyncio.to_thread(
-            client.messages.create,
+    model_metrics = {
+        "count": 0,
+        "durations": [],
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "cache_read_input_tokens": 0,
+        "cache_creation_input_tokens": 0,
+        "prompt_tokens": [],
+    }
+
+    system = system_prompt
+    if prompt_cache:
+        system = [{"type": "text", "text": system_prompt, "cache_control": CACHE_CONTROL}]
+        if tools:
+            tools = tools[:-1] + [{**tools[-1], "cache_control": CACHE_CONTROL}]
+
+    async def call_model():
+        if context is not None:
+            context.fit(messages)
+        model_start_ts = time.time()
+        response = await client.create(
+            priority=priority,
             model=model,
             max_tokens=4096,
-            system=EVALUATION_PROMPT,
-            messages=messages,
+            system=system,
+            messages=with_cache_breakpoint(messages) if prompt_cache else messages,
             tools=tools,
         )
-        messages.append({"role": "assistant", "content": response.content})
+        model_metrics["count"] += 1
+        model_metrics["durations"].append(time.time() - model_start_ts)
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            prompt_tokens = 0
+            for key in ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens"):
+                value = getattr(usage, key, None) or 0
+                model_metrics[key] += value
+                if key != "output_tokens":
+                    prompt_tokens += value
+            model_metrics["prompt_tokens"].append(prompt_tokens)
+        return response
+
+    # 每一轮是一次模型调用及其请求的全部工具调用
+    for turn in itertools.count():
+        with span("agent.turn", turn=turn):
+            response = await call_model()
+            messages.append({"role": "assistant", "content": response.content})
+            if response.stop_reason != "tool_use":
+                break
+
+            tool_uses = [block for block in response.content if block.type == "tool_use"]
+            tool_results = await asyncio.gather(
+                *(execute_tool(connection, tool_use) for tool_use in tool_uses)
+            )
+
+            for tool_use, (tool_response, tool_duration) in zip(tool_uses, tool_results):
+                if tool_use.name not in tool_metrics:
+                    tool_metrics[tool_use.name] = {"count": 0, "durations": []}
+                tool_metrics[tool_use.name]["count"] += 1
+                tool_metrics[tool_use.name]["durations"].append(tool_duration)
+
+            messages.append({
+                "role": "user",
+                "content": [
+                    {
+                        "type": "tool_result",
+                        "tool_use_id": tool_use.id,
+                        "content": context.cap_tool_result(tool_response) if context is not None else tool_response,
+                    }
+                    for tool_use, (tool_response, _) in zip(tool_uses, tool_results)
+                ],
+            })
 
     response_text = next(
         (block.text for block in response.content if hasattr(block, "text")),
         None,
     )
-    return response_text, tool_metrics
+    return response_text, tool_metrics, model_metrics
+
+
+async def evaluate_task(
+    client: ModelClient,
+    model: str,
+    qa_pair: dict[str, Any],
+    tools: list[dict[str, Any]],
+    connection: Any,
+    prompt_cache: bool = False,
+    context: ContextWindow | None = None,
+    scorer: str = "exact",
+    system_prompt: str = EVALUATION_PROMPT,
+) -> dict[str, Any]:
+    """运行单个评估任务并返回其结果；任务自带的 scorer 优先于默认评分器。"""
+    start_time = time.time()
+    with span("eval.task", index=qa_pair.get("index"), task_id=task_id(qa_pair), model=model) as task_span:
+        response, tool_metrics, model_metrics = await agent_loop(
+            client,
+            model,
+            qa_pair["question"],
+            tools,
+            connection,
+            prompt_cache=prompt_cache,
+            context=context,
+            system_prompt=system_prompt,
+        )
+
+    response_value = extract_xml_content(response, "response")
+    summary = extract_xml_content(response, "summary")
+    feedback = extract_xml_content(response, "feedback")
+    # 评分器出错时记 0 分并保留实际答案，修正评估文件后可以用 --rescore 重新评分
+    score, scorer_error = try_score_answer(response_value, qa_pair["answer"], qa_pair.get("scorer") or scorer)
+    task_span.set_attribute("score", score)
+
+    return {
+        "task_id": task_id(qa_pair),
+        "index": qa_pair.get("index"),
+        "question": qa_pair["question"],
+        "expected": qa_pair["answer"],
+        "actual": response_value,
+        "score": score,
+        # 只记录任务自带的评分器，重新评分时未指定评分器的任务改用新的默认值
+        "scorer": qa_pair.get("scorer"),
+        "scorer_error": scorer_error,
+        "total_duration": time.time() - start_time,
+        "tool_calls": tool_metrics,
+        "model_calls": model_metrics,
+        "summary": summary,
+        "feedback": feedback,
+    }
+
+
+async def run_tasks(
+    eval_path: Path,
+    connection: Any,
+    client: ModelClient,
+    tools: list[dict[str, Any]],
+    model: str,
+    concurrency: int = 1,
+    checkpoint: Path | None = None,
+    resume: bool = False,
+    report_writer: ReportWriter | None = None,
+    prompt_cache: bool = False,
+    shard: tuple[int, int] | None = None,
+    context: ContextWindow | None = None,
+    scorer: str = "exact",
+    system_prompt: str = EVALUATION_PROMPT,
+    label: str | None = None,
+) -> tuple[list[dict[str, Any]], dict[str, Any]]:
+    """用 concurrency 个 worker 运行评估文件中的任务。
+
+    返回按原始任务顺序排列的结果和本次运行的 run_stats；label 用作进度输出的前缀。
+    评估文件读取出错时不再调度新任务，进行中的任务完成后返回，run_stats 中的
+    incomplete 说明原因。
+    """
+    prefix = f"[{label}] " if label else ""
+    qa_pairs = iter_evaluation_file(eval_path, shard)
+    print(f"📋 {prefix}流式加载评估任务（并发数 {concurrency}）")
+
+    completed = load_checkpoint(checkpoint) if checkpoint and resume else {}
+    if completed:
+        print(f"⏩ {prefix}检查点中有 {len(completed)} 个已完成任务，将跳过")
+
+    checkpoint_file = None
+    if checkpoint:
+        checkpoint.parent.mkdir(parents=True, exist_ok=True)
+        if resume:
+            repair_checkpoint_tail(checkpoint)
+        checkpoint_file = checkpoint.open("a" if resume else "w", encoding="utf-8")
+
+    # position 是任务在本次（分片后）运行中的顺序，用于按原始顺序输出报告
+    results: dict[int, dict[str, Any]] = {}
+    tasks_run = 0
+    positioned = enumerate(qa_pairs)
+
+    def record(position: int, result: dict[str, Any]):
+        results[position] = result
+        if report_writer is not None:
+            report_writer.add(position, result)
+
+    file_error = None
+
+    def next_task() -> tuple[int, dict[str, Any]] | None:
+        """从共享迭代器取下一个任务；评估文件出错后不再调度新任务。"""
+        nonlocal file_error
+        if file_error is not None:
+            return None
+        try:
+            return next(positioned)
+        except StopIteration:
+            return None
+        except Exception as e:
+            file_error = e
+            print(f"❌ {prefix}解析评估文件 {eval_path} 时出错：{e}，不再调度新任务")
+            return None
+
+    async def worker():
+        nonlocal tasks_run
+        # 所有 worker 共享同一个惰性迭代器：任务在有空闲 worker 时才被解析和调度
+        while (item := next_task()) is not None:
+            position, qa_pair = item
+            restored = completed.get(task_id(qa_pair))
+            if restored is not None:
+                record(position, {**restored, "index": qa_pair["index"]})
+                continue
+
+            result = await evaluate_task(
+                client,
+                model,
+                qa_pair,
+                tools,
+                connection,
+                prompt_cache=prompt_cache,
+                context=context,
+                scorer=scorer,
+                system_prompt=system_prompt,
+            )
+            tasks_run += 1
+            record(position, result)
+            if checkpoint_file:
+                checkpoint_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+                checkpoint_file.flush()
+            print(
+                f"{'✅' if result['score'] else '❌'} {prefix}完成任务 {qa_pair['index'] + 1}"
+                f"（已完成 {len(results)}，{result['total_duration']:.1f}s）"
+            )
+            if result.get("scorer_error"):
+                print(f"⚠️ {prefix}任务 {qa_pair['index'] + 1} {result['scorer_error']}")
+
+    run_start = time.time()
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, concurrency))]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+        if checkpoint_file:
+            checkpoint_file.close()
+
+    run_stats = {"wall_time": time.time() - run_start, "tasks_run": tasks_run}
+    if file_error is not None:
+        run_stats["incomplete"] = f"读取评估文件 {eval_path} 时出错（{file_error}）"
+    return [results[position] for position in sorted(results)], run_stats
+
 
+def connection_stats(connection: Any) -> tuple[dict[str, Any] | None, dict[str, Any] | None]:
+    """返回连接（或连接池）上工具结果缓存和调用策略的统计。"""
+    cache = getattr(connection, "cache", None)
+    policy = getattr(connection, "policy", None)
+    return (cache.stats() if cache is not None else None, policy.stats() if policy is not None else None)
 
-async def run_evaluation(eval_path: Path, connection: Any, model: str = "claude-3-7-sonnet-20250219") -> str:
-    """使用 MCP 服务器工具运行评估。"""
+
+async def run_evaluation(
+    eval_path: Path,
+    connection: Any,
+    model: str = "claude-3-7-sonnet-20250219",
+    concurrency: int = 1,
+    max_in_flight: int = 32,
+    checkpoint: Path | None = None,
+    resume: bool = False,
+    report_writer: ReportWriter | None = None,
+    prompt_cache: bool = False,
+    client: ModelClient | None = None,
+    shard: tuple[int, int] | None = None,
+    context: ContextWindow | None = None,
+    scorer: str = "exact",
+    system_prompt: str = EVALUATION_PROMPT,
+) -> str:
+    """使用 MCP 服务器工具运行评估。
+
+    concurrency 控制同时运行的代理循环数量，max_in_flight 限制同时进行中的
+    模型请求数；报告始终按原始任务顺序输出。每个任务完成后立即追加到
+    checkpoint（JSONL）；resume 为 True 时跳过检查点中已完成的任务。
+
+    提供 report_writer 时，各任务段落在完成后立即写入磁盘，函数只返回摘要头部；
+    否则返回完整的 Markdown 报告。client 可传入自定义的 ModelClient（例如录制或
+    回放用的客户端），由调用方负责关闭；未提供时创建并在结束时关闭一个新的
+    AsyncAnthropic 客户端。
+
+    评估任务从文件中流式读取，由 concurrency 个 worker 按需取用；shard=(i, n)
+    时只运行第 i 个分片（从 0 开始）。scorer 是未在评估文件中指定评分器的任务
+    使用的默认评分器。
+
+    评估文件读取出错时，报告照常生成并标记为不完整，随后抛出带有该报告的
+    IncompleteEvaluationError。
+    """
     print("🚀 开始评估")
 
-    client = Anthropic()
-    tools = await connection.list_tools()
-    print(f"📋 从 MCP 服务器加载了 {len(tools)} 个工具")
-
-    qa_pairs = parse_evaluation_file(eval_path)
-    print(f"📋 加载了 {len(qa_pairs)} 个评估任务")
-
-    results = []
-    for i, qa_pair in enumerate(qa_pairs):
-        print(f"处理任务 {i + 1}/{len(qa_pairs)}")
-        start_time = time.time()
-        response, tool_metrics = await agent_loop(client, model, qa_pair["question"], tools, connection)
-        
-        response_value = extract_xml_content(response, "response")
-        summary = extract_xml_content(response, "summary")
-        feedback = extract_xml_content(response, "feedback")
-        
-        results.append({
-            "question": qa_pair["question"],
-            "expected": qa_pair["answer"],
-            "actual": response_value,
-            "score": int(response_value == qa_pair["answer"]) if response_value else 0,
-            "total_duration": time.time() - start_time,
-            "tool_calls": tool_metrics,
-            "summary": summary,
-            "feedback": feedback,
-        })
-
-    correct = sum(r["score"] for r in results)
-    accuracy = (correct / len(results)) * 100 if results else 0
-
-    report = f"""
-# 评估报告
-
-## 摘要
-
-- **准确率**: {correct}/{len(results)} ({accuracy:.1f}%)
-- **总工具调用次数**: {sum(sum(len(m["durations"]) for m in r["tool_calls"].values()) for r in results)}
-
----
-"""
+    owns_client = client is None
+    client = client or ModelClient(max_in_flight)
+    try:
+        tools = await connection.list_tools()
+        print(f"📋 从 MCP 服务器加载了 {len(tools)} 个工具")
+        results, run_stats = await run_tasks(
+            eval_path,
+            connection,
+            client,
+            tools,
+            model,
+            concurrency,
+            checkpoint=checkpoint,
+            resume=resume,
+            report_writer=report_writer,
+            prompt_cache=prompt_cache,
+            shard=shard,
+            context=context,
+            scorer=scorer,
+            system_prompt=system_prompt,
+        )
+    finally:
+        if owns_client:
+            await client.close()
+
+    cache_stats, policy_stats = connection_stats(connection)
+    context_stats = context.stats() if context is not None else None
+    scheduler_stats = client.scheduler.stats()
+    if report_writer is not None:
+        summary = render_summary(results, cache_stats, run_stats, policy_stats, context_stats, scheduler_stats)
+        report_writer.finish(summary)
+        report = summary
+    else:
+        report = render_report(results, cache_stats, run_stats, policy_stats, context_stats, scheduler_stats)
+    if run_stats.get("incomplete"):
+        raise IncompleteEvaluationError(run_stats["incomplete"], report)
+    return report
 
-    for i, result in enumerate(results):
-        report += f"""
-### 任务 {i + 1}
 
-**问题**: {result["question"]}
-**预期答案**: `{result["expected"]}`
-**实际答案**: `{result["actual"] or "N/A"}`
-**正确**: {"✅" if result["score"] else "❌"}
+def matrix_configs(models: list[str], system_prompt_files: list[Path] | None = None) -> list[dict[str, Any]]:
+    """生成模型 × 系统提示的全部组合；每个组合有一个用于报告和文件名的 name。"""
+    prompts = [(path.stem, path.read_text(encoding="utf-8")) for path in system_prompt_files or []]
+    if not prompts:
+        prompts = [(None, EVALUATION_PROMPT)]
+    return [
+        {"name": f"{model}+{prompt_name}" if prompt_name else model, "model": model, "system_prompt": prompt}
+        for model in models
+        for prompt_name, prompt in prompts
+    ]
 
----
-"""
 
+def config_path(path: Path, name: str) -> Path:
+    """在 path 的文件名中插入组合名，例如 run.jsonl → run.<name>.jsonl。"""
+    safe_name = re.sub(r"[^\w.-]+", "_", name)
+    return path.with_name(f"{path.stem}.{safe_name}{path.suffix}")
+
+
+async def run_matrix(
+    eval_path: Path,
+    connection: Any,
+    configs: list[dict[str, Any]],
+    concurrency: int = 1,
+    max_in_flight: int = 32,
+    checkpoint: Path | None = None,
+    resume: bool = False,
+    output: Path | None = None,
+    prompt_cache: bool = False,
+    client: ModelClient | None = None,
+    shard: tuple[int, int] | None = None,
+    make_context: Callable[[], ContextWindow | None] = lambda: None,
+    scorer: str = "exact",
+    prices: dict[str, tuple[float, float]] | None = None,
+) -> str:
+    """在同一个 MCP 连接（池）上并发运行多个模型/系统提示组合，返回对比报告。
+
+    每个组合各有 concurrency 个 worker，所有组合共享一个 ModelClient，
+    max_in_flight 限制所有组合合计的进行中模型请求数；工具目录只加载一次。
+    提供 checkpoint 或 output 时，每个组合写入名称带有组合名的检查点和详细报告。
+    """
+    print(f"🚀 开始矩阵评估：{len(configs)} 个组合")
+
+    owns_client = client is None
+    client = client or ModelClient(max_in_flight)
+    try:
+        tools = await connection.list_tools()
+        print(f"📋 从 MCP 服务器加载了 {len(tools)} 个工具")
+
+        async def run_config(config: dict[str, Any]) -> dict[str, Any]:
+            context = make_context()
+            report_writer = ReportWriter(config_path(output, config["name"])) if output else None
+            try:
+                results, run_stats = await run_tasks(
+                    eval_path,
+                    connection,
+                    client,
+                    tools,
+                    config["model"],
+                    concurrency,
+                    checkpoint=config_path(checkpoint, config["name"]) if checkpoint else None,
+                    resume=resume,
+                    report_writer=report_writer,
+                    prompt_cache=prompt_cache,
+                    shard=shard,
+                    context=context,
+                    scorer=scorer,
+                    system_prompt=config["system_prompt"],
+                    label=config["name"],
+                )
+            finally:
+                if report_writer is not None:
+                    report_writer.close()
+            if report_writer is not None:
+                context_stats = context.stats() if context is not None else None
+                report_writer.finish(render_summary(results, None, run_stats, None, context_stats))
+            return {**config, "results": results, "run_stats": run_stats}
+
+        runs = await asyncio.gather(*(run_config(config) for config in configs))
+    finally:
+        if owns_client:
+            await client.close()
+
+    cache_stats, policy_stats = connection_stats(connection)
+    report = render_matrix(runs, cache_stats, policy_stats, prices, client.scheduler.stats())
+    incomplete = next((run["run_stats"]["incomplete"] for run in runs if run["run_stats"].get("incomplete")), None)
+    if incomplete:
+        raise IncompleteEvaluationError(incomplete, report)
     return report
 
 
+def rescore_results(
+    results: list[dict[str, Any]], eval_path: Path | None = None, scorer: str = "exact"
+) -> list[dict[str, Any]]:
+    """离线重新评分已保存的结果，不调用模型或 MCP 服务器。
+
+    提供 eval_path 时按任务 ID 使用评估文件中各任务当前指定的评分器，否则沿用
+    结果中记录的任务评分器；两者都没有的任务使用默认评分器 scorer。
+    """
+    scorers = {}
+    if eval_path is not None:
+        scorers = {task_id(qa_pair): qa_pair.get("scorer") for qa_pair in iter_evaluation_file(eval_path)}
+
+    rescored = []
+    for result in results:
+        task_scorer = scorers.get(result["task_id"]) if eval_path is not None else result.get("scorer")
+        score, scorer_error = try_score_answer(result["actual"], result["expected"], task_scorer or scorer)
+        rescored.append({**result, "score": score, "scorer": task_scorer, "scorer_error": scorer_error})
+    return rescored
+
+
+def scorer_spec(value: str) -> str:
+    """argparse 类型：校验评分器规格。"""
+    try:
+        resolve_scorer(value)
+    except (ValueError, ImportError) as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+    return value
+
+
+def tool_result_chars(value: str) -> int:
+    """argparse 类型：工具结果字符上限，至少为 2（首尾各保留一半）。"""
+    try:
+        chars = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"需要整数：{value}") from None
+    if chars < 2:
+        raise argparse.ArgumentTypeError(f"工具结果字符上限至少为 2：{value}")
+    return chars
+
+
 async def main():
     parser = argparse.ArgumentParser(description="使用测试问题评估 MCP 服务器")
-    parser.add_argument("eval_file", type=Path, help="评估 XML 文件路径")
+    parser.add_argument("eval_file", type=Path, nargs="?", help="评估文件路径（.xml、.jsonl 或 .csv）")
     parser.add_argument("-t", "--transport", choices=["stdio", "sse", "http"], default="stdio")
     parser.add_argument("-m", "--model", default="claude-3-7-sonnet-20250219")
     parser.add_argument("-c", "--command", help="运行 MCP 服务器的命令")
@@ -222,8 +780,68 @@ async def main():
     parser.add_argument("-u", "--url", help="MCP 服务器 URL")
     parser.add_argument("-H", "--header", nargs="+", dest="headers")
     parser.add_argument("-o", "--output", type=Path)
+    parser.add_argument("--shard", type=parse_shard, metavar="I/N", help="只运行 N 个分片中的第 I 个（从 1 开始）")
+    parser.add_argument("-j", "--concurrency", type=int, default=1, help="同时运行的评估任务数（默认：1）")
+    parser.add_argument("--max-in-flight", type=int, default=32, help="同时进行中的模型请求上限（默认：32），遇到限速时自动降低")
+    parser.add_argument("--rpm", type=int, help="每分钟最多发送的模型请求数")
+    parser.add_argument("--tpm", type=int, help="每分钟最多使用的模型令牌数（输入 + 输出）")
+    parser.add_argument("-p", "--pool-size", type=int, default=1, help="打开的 MCP 会话数（默认：1）")
+    parser.add_argument("--cache-tools", nargs="+", help="可缓存结果的只读工具名（'*' 表示全部）")
+    parser.add_argument("--cache-ttl", type=float, default=3600.0, help="工具结果缓存有效期，秒（默认：3600）")
+    parser.add_argument("--cache-size", type=int, default=1024, help="工具结果缓存最大条目数（默认：1024）")
+    parser.add_argument("--cache-file", type=Path, help="工具结果缓存的持久化文件")
+    parser.add_argument("--tool-timeout", type=float, default=120.0, help="单次工具调用超时，秒（默认：120，0 表示不限制）")
+    parser.add_argument("--tool-timeouts", nargs="+", metavar="TOOL=SECONDS", help="按工具覆盖的超时")
+    parser.add_argument("--retries", type=int, default=0, help="幂等工具超时或连接出错后的重试次数（默认：0）")
+    parser.add_argument("--idempotent-tools", nargs="+", default=[], help="可安全重试和对冲的工具名（'*' 表示全部）")
+    parser.add_argument("--hedge-after", type=float, help="幂等工具调用超过此秒数未返回时在另一个池化会话上发出对冲请求")
+    parser.add_argument("--max-tool-result-chars", type=tool_result_chars, default=50000, help="单个工具结果的字符上限（默认：50000）")
+    parser.add_argument("--max-context-tokens", type=int, default=150000, help="对话的估算令牌预算，超出时省略较早的工具结果（默认：150000）")
+    parser.add_argument("--models", nargs="+", help="矩阵模式：在同一组 MCP 连接上并发评估多个模型")
+    parser.add_argument("--system-prompts", nargs="+", type=Path, metavar="FILE", help="矩阵模式：要对比的系统提示文件")
+    parser.add_argument("--token-prices", nargs="+", metavar="MODEL=INPUT/OUTPUT", help="每百万令牌的美元单价，用于估算成本")
+    parser.add_argument("--scorer", type=scorer_spec, default="exact", help="默认评分器，例如 normalized、numeric:0.01（默认：exact）")
+    parser.add_argument("--rescore", type=Path, nargs="+", metavar="CHECKPOINT", help="离线重新评分检查点中的结果，不调用模型或服务器")
+    parser.add_argument("--trace", type=Path, help="把模型调用、工具调用和连接建立的 span 写入此文件")
+    parser.add_argument("--trace-format", choices=["chrome", "otlp"], default="chrome", help="追踪文件格式（默认：chrome）")
+    parser.add_argument("--prompt-cache", action="store_true", help="缓存系统提示、工具定义和对话前缀")
+    parser.add_argument("--checkpoint", type=Path, help="每个任务完成后追加结果的 JSONL 检查点文件")
+    parser.add_argument("--resume", action="store_true", help="跳过检查点中已完成的任务（需要 --checkpoint）")
+    parser.add_argument("--tools-cache", type=Path, help="工具目录缓存文件，跨运行复用 list_tools 结果")
+    cassette_group = parser.add_mutually_exclusive_group()
+    cassette_group.add_argument("--record", type=Path, metavar="CASSETTE", help="把模型响应和工具结果录制到 cassette 文件")
+    cassette_group.add_argument("--replay", type=Path, metavar="CASSETTE", help="从 cassette 离线回放，不访问模型 API 或 MCP 服务器")
+    parser.add_argument("--replay-latency", type=float, default=0.0, help="回放时按录制耗时的倍数等待（默认：0，不等待）")
 
     args = parser.parse_args()
+    if args.resume and not args.checkpoint:
+        parser.error("--resume 需要 --checkpoint")
+    if args.checkpoint and args.output:
+        report_paths = {path.resolve() for path in ReportWriter(args.output).paths}
+        if args.checkpoint.resolve() in report_paths:
+            parser.error(f"--checkpoint {args.checkpoint} 与 -o 生成的报告文件重名")
+
+    if args.rescore:
+        results = []
+        for path in args.rescore:
+            results.extend(load_checkpoint(path).values())
+        results.sort(key=lambda r: (r.get("index") is None, r.get("index") or 0))
+        before = sum(r["score"] for r in results)
+        results = rescore_results(results, args.eval_file, args.scorer)
+        after = sum(r["score"] for r in results)
+        print(f"📋 重新评分了 {len(results)} 个任务结果：正确数 {before} → {after}")
+        for result in results:
+            if result.get("scorer_error"):
+                print(f"⚠️ 任务 {(result.get('index') or 0) + 1} {result['scorer_error']}")
+        report = render_report(results)
+        if args.output:
+            args.output.write_text(report, encoding="utf-8")
+            print(f"✅ 报告已保存到 {args.output}")
+        else:
+            print(report)
+        return
+    if args.eval_file is None:
+        parser.error("需要提供评估文件")
 
     headers = {}
     if args.headers:
@@ -239,22 +857,135 @@ async def main():
                 k, v = e.split("=", 1)
                 env_vars[k.strip()] = v.strip()
 
-    connection = create_connection(
-        transport=args.transport,
+    cache = None
+    if args.cache_tools:
+        cache = ToolResultCache(
+            args.cache_tools, ttl=args.cache_ttl, max_entries=args.cache_size, path=args.cache_file
+        )
+
+    catalog = ToolCatalogCache(path=args.tools_cache)
+
+    tool_timeouts = {}
+    for item in args.tool_timeouts or []:
+        if "=" in item:
+            k, v = item.split("=", 1)
+            tool_timeouts[k.strip()] = float(v)
+    policy = ToolCallPolicy(
+        timeout=args.tool_timeout or None,
+        tool_timeouts=tool_timeouts,
+        retries=args.retries,
+        idempotent_tools=args.idempotent_tools,
+        hedge_after=args.hedge_after,
+    )
+
+    connection_kwargs = dict(
         command=args.command,
         args=args.args,
         env=env_vars or None,
         url=args.url,
         headers=headers or None,
+        catalog=catalog,
     )
+    scheduler = RateLimitScheduler(args.max_in_flight, rpm=args.rpm, tpm=args.tpm)
+    model_client = None
+    cassette = None
+    if args.replay:
+        cassette = Cassette.load(args.replay)
+        connection = ReplayConnection(cassette, args.replay_latency)
+        model_client = ModelClient(client=ReplayAnthropic(cassette, args.replay_latency), scheduler=scheduler)
+    elif args.pool_size > 1:
+        connection = create_connection_pool(
+            args.transport, size=args.pool_size, cache=cache, policy=policy, **connection_kwargs
+        )
+    else:
+        connection = create_connection(transport=args.transport, cache=cache, policy=policy, **connection_kwargs)
 
-    async with connection:
-        report = await run_evaluation(args.eval_file, connection, args.model)
-        if args.output:
-            args.output.write_text(report, encoding='utf-8')
-            print(f"✅ 报告已保存到 {args.output}")
-        else:
-            print(report)
+    if args.record:
+        cassette = Cassette(args.record)
+        connection = RecordingConnection(connection, cassette)
+        model_client = ModelClient(client=RecordingAnthropic(AsyncAnthropic(max_retries=0), cassette), scheduler=scheduler)
+    model_client = model_client or ModelClient(scheduler=scheduler)
+
+    matrix = args.models is not None and len(args.models) > 1 or bool(args.system_prompts)
+    report_writer = ReportWriter(args.output) if args.output and not matrix else None
+
+    tracer = Tracer() if args.trace else None
+    set_tracer(tracer)
+    incomplete = None
+    try:
+        async with connection:
+            try:
+                if matrix:
+                    prices = {}
+                    for item in args.token_prices or []:
+                        if "=" in item and "/" in item:
+                            k, v = item.split("=", 1)
+                            input_price, output_price = v.split("/", 1)
+                            prices[k.strip()] = (float(input_price), float(output_price))
+                    try:
+                        report = await run_matrix(
+                            args.eval_file,
+                            connection,
+                            matrix_configs(args.models or [args.model], args.system_prompts),
+                            args.concurrency,
+                            args.max_in_flight,
+                            checkpoint=args.checkpoint,
+                            resume=args.resume,
+                            output=args.output,
+                            prompt_cache=args.prompt_cache,
+                            client=model_client,
+                            shard=args.shard,
+                            make_context=lambda: ContextWindow(args.max_tool_result_chars, args.max_context_tokens),
+                            scorer=args.scorer,
+                            prices=prices,
+                        )
+                    except IncompleteEvaluationError as e:
+                        report, incomplete = e.report, e
+                    if args.output:
+                        args.output.write_text(report, encoding="utf-8")
+                    print(report)
+                    if args.output:
+                        print(f"✅ 对比报告已保存到 {args.output}，各组合的详细报告保存在同一目录")
+                else:
+                    try:
+                        report = await run_evaluation(
+                            args.eval_file,
+                            connection,
+                            args.models[0] if args.models else args.model,
+                            args.concurrency,
+                            args.max_in_flight,
+                            checkpoint=args.checkpoint,
+                            resume=args.resume,
+                            report_writer=report_writer,
+                            prompt_cache=args.prompt_cache,
+                            client=model_client,
+                            shard=args.shard,
+                            context=ContextWindow(args.max_tool_result_chars, args.max_context_tokens),
+                            scorer=args.scorer,
+                        )
+                    except IncompleteEvaluationError as e:
+                        report, incomplete = e.report, e
+            finally:
+                if report_writer is not None:
+                    report_writer.close()
+                await model_client.close()
+                if cache is not None:
+                    cache.save()
+                catalog.save()
+                if args.record:
+                    cassette.save()
+            if not matrix:
+                print(report)
+                if args.output:
+                    print(f"✅ 报告已保存到 {args.output}（以及 {report_writer.jsonl_path.name}、{report_writer.csv_path.name}）")
+    finally:
+        if tracer is not None:
+            tracer.export(args.trace, args.trace_format)
+            print(f"📈 追踪已保存到 {args.trace}（{len(tracer.spans)} 个 span）")
+
+    if incomplete is not None:
+        print(f"❌ 报告不完整：{incomplete}")
+        sys.exit(1)
 
 
 if __name__ == "__main__":
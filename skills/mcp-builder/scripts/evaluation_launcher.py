@@ -0,0 +1,109 @@
+"""多进程分片评估启动器
+
+把评估集拆分到多个 evaluation.py 工作进程（每个进程有自己的事件循环和 MCP 连接），
+然后把各分片的检查点合并成一份报告，给出合并后的准确率和延迟统计。
+
+用法：
+    python evaluation_launcher.py -w 4 -d runs/eval -o report.md -- -t stdio -c python -a my_server.py -j 8 evaluation.xml
+
+    # 只合并已有的检查点（例如多台机器分别用 --shard 运行的结果）
+    python evaluation_launcher.py --merge runs/*/shard-*.jsonl -o report.md
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+from evaluation import load_checkpoint
+from report import render_report
+
+
+def merge_checkpoints(paths: list[Path]) -> list[dict[str, Any]]:
+    """合并多个检查点文件，按任务 ID 去重并按评估文件中的位置排序。"""
+    merged: dict[str, dict[str, Any]] = {}
+    for path in paths:
+        merged.update(load_checkpoint(path))
+    return sorted(merged.values(), key=lambda r: (r.get("index") is None, r.get("index") or 0))
+
+
+async def run_worker(shard: int, workers: int, work_dir: Path, passthrough: list[str], resume: bool) -> int:
+    """运行一个分片的 evaluation.py 进程，输出写入日志文件，返回退出码。"""
+    checkpoint = work_dir / f"shard-{shard}-of-{workers}.jsonl"
+    log_path = work_dir / f"shard-{shard}-of-{workers}.log"
+    command = [
+        sys.executable,
+        str(Path(__file__).resolve().with_name("evaluation.py")),
+        *passthrough,
+        "--shard", f"{shard}/{workers}",
+        "--checkpoint", str(checkpoint),
+    ]
+    if resume:
+        command.append("--resume")
+
+    with log_path.open("w", encoding="utf-8") as log:
+        process = await asyncio.create_subprocess_exec(*command, stdout=log, stderr=asyncio.subprocess.STDOUT)
+        returncode = await process.wait()
+
+    status = "✅" if returncode == 0 else f"❌ 退出码 {returncode}"
+    print(f"{status} 分片 {shard}/{workers} 结束（日志：{log_path}）")
+    return returncode
+
+
+async def launch(workers: int, work_dir: Path, passthrough: list[str], resume: bool) -> list[int]:
+    work_dir.mkdir(parents=True, exist_ok=True)
+    print(f"🚀 启动 {workers} 个评估工作进程，工作目录 {work_dir}")
+    return await asyncio.gather(
+        *(run_worker(shard, workers, work_dir, passthrough, resume) for shard in range(1, workers + 1))
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="把评估集拆分到多个进程运行并合并报告",
+        epilog="'--' 之后的参数原样传给每个 evaluation.py 进程（不要包含 --shard、--checkpoint 或 -o）",
+    )
+    parser.add_argument("-w", "--workers", type=int, default=4, help="工作进程数（默认：4）")
+    parser.add_argument("-d", "--work-dir", type=Path, default=Path("eval-shards"), help="检查点和日志目录")
+    parser.add_argument("-o", "--output", type=Path, help="合并报告输出文件（默认：打印到 stdout）")
+    parser.add_argument("--resume", action="store_true", help="各分片从已有检查点继续")
+    parser.add_argument("--merge", nargs="+", type=Path, metavar="CHECKPOINT", help="只合并给定的检查点，不启动进程")
+    args, passthrough = parser.parse_known_args()
+    if passthrough and passthrough[0] == "--":
+        passthrough = passthrough[1:]
+
+    start_ts = time.time()
+    failed = 0
+    if args.merge:
+        checkpoints = args.merge
+    else:
+        if not passthrough:
+            parser.error("需要在 '--' 之后提供 evaluation.py 的参数")
+        returncodes = asyncio.run(launch(args.workers, args.work_dir, passthrough, args.resume))
+        failed = sum(1 for code in returncodes if code != 0)
+        checkpoints = sorted(args.work_dir.glob(f"shard-*-of-{args.workers}.jsonl"))
+
+    results = merge_checkpoints(checkpoints)
+    print(f"📋 从 {len(checkpoints)} 个检查点合并了 {len(results)} 个任务结果")
+    # 只合并时不知道原始运行的耗时，性能部分省略吞吐量
+    wall_time = None if args.merge else time.time() - start_ts
+    run_stats = {"wall_time": wall_time, "tasks_run": len(results)}
+    if failed:
+        run_stats["incomplete"] = f"{failed} 个分片失败"
+    report = render_report(results, run_stats=run_stats)
+
+    if args.output:
+        args.output.write_text(report, encoding="utf-8")
+        print(f"✅ 合并报告已保存到 {args.output}")
+    else:
+        print(report)
+
+    if failed:
+        print(f"❌ {failed} 个分片失败，报告只包含已完成的任务")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
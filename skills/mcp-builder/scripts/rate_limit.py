@@ -0,0 +1,253 @@
+"""模型请求的限速调度。
+
+RateLimitScheduler 在所有并发任务之间调度模型请求：
+
+- 按滑动的 60 秒窗口统计请求数和令牌数，可选地限制每分钟请求数（rpm）和令牌数（tpm）
+- 用 AIMD 调整并发上限：每次成功加性增加，遇到 429/529 时减半，并按
+  retry-after 或带抖动的指数退避暂停所有请求
+- 读取 anthropic-ratelimit-* 响应头，剩余额度耗尽时暂停到额度重置
+- 连接错误和 408/409/5xx 等瞬时错误按同样的退避只重试出错的请求，不影响并发上限
+  （与 SDK 自带的重试范围一致，因此 SDK 的重试可以关闭）
+- 等待中的请求按优先级（默认是所属任务的开始时间）排队，先开始的任务先获得
+  并发槽位，重试的请求保留原来的优先级
+"""
+
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable
+
+from anthropic import APIConnectionError, APIStatusError
+
+RATE_LIMIT_STATUS = (429, 529)
+
+WINDOW_SECONDS = 60.0
+
+
+def _header_float(headers: Any, name: str) -> float | None:
+    value = headers.get(name) if headers is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _seconds_until(timestamp: str | None) -> float | None:
+    """把 RFC 3339 格式的重置时间转换为距现在的秒数。"""
+    if not timestamp:
+        return None
+    try:
+        reset = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return max(0.0, (reset - datetime.now(timezone.utc)).total_seconds())
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    return isinstance(error, APIStatusError) and error.status_code in RATE_LIMIT_STATUS
+
+
+def is_transient(error: BaseException) -> bool:
+    """连接错误（含超时）和 408/409/5xx 响应，限速错误除外。"""
+    if isinstance(error, APIConnectionError):
+        return True
+    return (
+        isinstance(error, APIStatusError)
+        and not is_rate_limited(error)
+        and (error.status_code in (408, 409) or error.status_code >= 500)
+    )
+
+
+class RateLimitScheduler:
+    """自适应并发和速率预算的模型请求调度器。
+
+    参数：
+        max_concurrency: 并发上限的最大值，也是初始值
+        rpm: 每分钟最多发送的请求数（None 表示不限制）
+        tpm: 每分钟最多使用的令牌数，按输入和输出令牌合计（None 表示不限制）
+        max_retries: 单个请求遇到限速或瞬时错误后的最大重试次数
+        backoff_base: 没有 retry-after 时首次退避的秒数
+        backoff_max: 退避秒数的上限
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 32,
+        rpm: int | None = None,
+        tpm: int | None = None,
+        max_retries: int = 8,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = float(self.max_concurrency)
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.in_flight = 0
+        self._waiters: list[tuple[float, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._requests: deque[float] = deque()
+        self._tokens: deque[tuple[float, int]] = deque()
+        self._window_tokens = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._consecutive_limited = 0
+
+        self.requests = 0
+        self.rate_limited = 0
+        self.transient_errors = 0
+        self.retries = 0
+        self.waited = 0.0
+        self.min_limit = self.limit
+
+    async def _acquire(self, priority: float):
+        if not self._waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 槽位已经分配但调用方被取消时，把槽位还回去
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+
+    def _release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+    def _prune(self, now: float):
+        while self._requests and self._requests[0] <= now - WINDOW_SECONDS:
+            self._requests.popleft()
+        while self._tokens and self._tokens[0][0] <= now - WINDOW_SECONDS:
+            self._window_tokens -= self._tokens.popleft()[1]
+
+    async def _wait_for_budget(self):
+        """等待暂停结束以及 rpm/tpm 窗口出现余量，然后登记一次请求。"""
+        while True:
+            now = time.monotonic()
+            self._prune(now)
+            if self._paused_until > now:
+                delay = self._paused_until - now
+            elif self.rpm and len(self._requests) >= self.rpm:
+                delay = self._requests[0] + WINDOW_SECONDS - now
+            elif self.tpm and self._tokens and self._window_tokens >= self.tpm:
+                delay = self._tokens[0][0] + WINDOW_SECONDS - now
+            else:
+                self._requests.append(now)
+                self.requests += 1
+                return
+            self.waited += delay
+            await asyncio.sleep(delay)
+
+    def _pause(self, delay: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+
+    def _backoff(self, error: BaseException, failures: int) -> float:
+        """优先使用 retry-after，否则按连续失败次数做带抖动的指数退避。"""
+        headers = getattr(getattr(error, "response", None), "headers", None)
+        delay = _header_float(headers, "retry-after")
+        if delay is None:
+            backoff = min(self.backoff_max, self.backoff_base * 2 ** (failures - 1))
+            delay = random.uniform(backoff / 2, backoff)
+        return delay
+
+    def _on_rate_limited(self, error: APIStatusError):
+        self.rate_limited += 1
+        self._consecutive_limited += 1
+        delay = self._backoff(error, self._consecutive_limited)
+        self._pause(delay)
+
+        # 同一批并发请求可能同时收到 429，在一次退避时间内只减半一次
+        now = time.monotonic()
+        if now - self._last_decrease >= delay:
+            self.limit = max(1.0, self.limit / 2)
+            self.min_limit = min(self.min_limit, self.limit)
+            self._last_decrease = now
+
+    def _on_success(self, response: Any, headers: Any):
+        self._consecutive_limited = 0
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            tokens = (getattr(usage, "input_tokens", 0) or 0) + (getattr(usage, "output_tokens", 0) or 0)
+            self._tokens.append((time.monotonic(), tokens))
+            self._window_tokens += tokens
+
+        exhausted = False
+        for kind in ("requests", "tokens", "input-tokens", "output-tokens"):
+            remaining = _header_float(headers, f"anthropic-ratelimit-{kind}-remaining")
+            if remaining is None:
+                continue
+            # 剩余请求数不足以覆盖进行中的请求时也视为耗尽，避免一批请求同时撞上 429
+            if remaining <= 0 or (kind == "requests" and remaining < self.in_flight):
+                exhausted = True
+                reset = _seconds_until(headers.get(f"anthropic-ratelimit-{kind}-reset"))
+                if reset:
+                    self._pause(reset)
+        if not exhausted:
+            self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+
+    async def run(
+        self, send: Callable[[], Awaitable[tuple[Any, Any]]], priority: float | None = None
+    ) -> Any:
+        """在并发上限和速率预算内执行 send()，遇到限速或瞬时错误时退避并重试。
+
+        send 返回 (response, headers)，headers 可以为 None。
+        """
+        priority = time.monotonic() if priority is None else priority
+        transient_failures = 0
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(priority)
+            retry_delay = None
+            try:
+                await self._wait_for_budget()
+                response, headers = await send()
+            except (APIStatusError, APIConnectionError) as e:
+                if attempt == self.max_retries or not (is_rate_limited(e) or is_transient(e)):
+                    raise
+                self.retries += 1
+                if is_rate_limited(e):
+                    self._on_rate_limited(e)
+                    continue
+                # 瞬时错误只让这个请求等待，等待期间让出并发槽位
+                self.transient_errors += 1
+                transient_failures += 1
+                retry_delay = self._backoff(e, transient_failures)
+            finally:
+                self._release()
+            if retry_delay is not None:
+                self.waited += retry_delay
+                await asyncio.sleep(retry_delay)
+                continue
+            self._on_success(response, headers)
+            self._wake()
+            return response
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "rate_limited": self.rate_limited,
+            "transient_errors": self.transient_errors,
+            "retries": self.retries,
+            "waited": self.waited,
+            "concurrency": int(self.limit),
+            "min_concurrency": int(self.min_limit),
+        }
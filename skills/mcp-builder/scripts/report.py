@@ -0,0 +1,331 @@
+"""评估报告的渲染与增量写入。"""
+
+import csv
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+CSV_FIELDS = [
+    "index", "task_id", "question", "expected", "actual", "score",
+    "total_duration", "tool_calls", "input_tokens", "output_tokens",
+]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """线性插值计算百分位数；空列表返回 0。"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def _latency_row(label: str, values: list[float]) -> str:
+    return (
+        f"| {label} | {len(values)} | {percentile(values, 50):.3f} | {percentile(values, 90):.3f}"
+        f" | {percentile(values, 99):.3f} | {max(values, default=0):.3f} |"
+    )
+
+
+def render_performance(results: list[dict[str, Any]], run_stats: dict[str, Any]) -> str:
+    """渲染性能部分：各工具和任务的延迟百分位数、模型/工具耗时、吞吐量和令牌用量。
+
+    run_stats 包含本次运行的 wall_time（秒，未知时为 None，此时省略吞吐量）和
+    tasks_run（实际执行的任务数，不含从检查点恢复的任务）。
+    """
+    tool_durations: dict[str, list[float]] = {}
+    for r in results:
+        for name, metrics in r["tool_calls"].items():
+            tool_durations.setdefault(name, []).extend(metrics["durations"])
+    task_durations = [r["total_duration"] for r in results]
+    model_calls = [r.get("model_calls") or {} for r in results]
+    model_durations = [d for m in model_calls for d in m.get("durations", [])]
+    model_time = sum(model_durations)
+    tool_time = sum(sum(d) for d in tool_durations.values())
+    busy_time = model_time + tool_time
+    input_tokens = sum(m.get("input_tokens", 0) for m in model_calls)
+    output_tokens = sum(m.get("output_tokens", 0) for m in model_calls)
+    cache_read_tokens = sum(m.get("cache_read_input_tokens", 0) for m in model_calls)
+    cache_write_tokens = sum(m.get("cache_creation_input_tokens", 0) for m in model_calls)
+    prompt_sizes = [t for m in model_calls for t in m.get("prompt_tokens", [])]
+    wall_time = run_stats.get("wall_time")
+    tasks_run = run_stats.get("tasks_run", len(results))
+
+    lines = ["## 性能", ""]
+    if wall_time is not None:
+        tasks_per_minute = tasks_run / wall_time * 60 if wall_time else 0.0
+        lines.append(f"- **运行时间**: {wall_time:.1f}s，执行 {tasks_run} 个任务（{tasks_per_minute:.2f} 任务/分钟）")
+    lines += [
+        f"- **模型调用时间**: {model_time:.1f}s（{model_time / busy_time * 100 if busy_time else 0:.1f}%），"
+        f"共 {len(model_durations)} 次调用",
+        f"- **工具调用时间**: {tool_time:.1f}s（{tool_time / busy_time * 100 if busy_time else 0:.1f}%）",
+        f"- **令牌用量**: 输入 {input_tokens}，输出 {output_tokens}；"
+        f"平均每任务 {input_tokens / len(results) if results else 0:.0f} / {output_tokens / len(results) if results else 0:.0f}",
+        f"- **提示缓存令牌**: 读取 {cache_read_tokens}，写入 {cache_write_tokens}",
+        f"- **每轮提示大小（令牌）**: p50 {percentile(prompt_sizes, 50):.0f}，p90 {percentile(prompt_sizes, 90):.0f}，"
+        f"最大 {max(prompt_sizes, default=0)}",
+        "",
+        "| 延迟（秒） | 次数 | p50 | p90 | p99 | 最大 |",
+        "|---|---|---|---|---|---|",
+        _latency_row("任务总耗时", task_durations),
+        _latency_row("模型调用", model_durations),
+    ]
+    lines.extend(_latency_row(f"工具 `{name}`", durations) for name, durations in sorted(tool_durations.items()))
+    return "\n".join(lines) + "\n"
+
+
+def render_scheduler_stats(scheduler_stats: dict[str, Any]) -> str:
+    return (
+        f"- **模型请求调度**: 请求 {scheduler_stats['requests']}，限速 {scheduler_stats['rate_limited']} 次，"
+        f"瞬时错误重试 {scheduler_stats.get('transient_errors', 0)} 次，"
+        f"请求累计等待 {scheduler_stats['waited']:.1f}s；并发上限当前 {scheduler_stats['concurrency']}"
+        f"（最低 {scheduler_stats['min_concurrency']}）"
+    )
+
+
+def render_summary(
+    results: list[dict[str, Any]],
+    cache_stats: dict[str, Any] | None = None,
+    run_stats: dict[str, Any] | None = None,
+    policy_stats: dict[str, Any] | None = None,
+    context_stats: dict[str, Any] | None = None,
+    scheduler_stats: dict[str, Any] | None = None,
+) -> str:
+    """渲染报告的摘要头部；提供 run_stats 时附带性能部分。"""
+    correct = sum(r["score"] for r in results)
+    accuracy = (correct / len(results)) * 100 if results else 0
+    total_tool_calls = sum(sum(len(m["durations"]) for m in r["tool_calls"].values()) for r in results)
+
+    lines = [
+        f"- **准确率**: {correct}/{len(results)} ({accuracy:.1f}%)",
+        f"- **总工具调用次数**: {total_tool_calls}",
+    ]
+    if run_stats and run_stats.get("incomplete"):
+        lines.insert(0, f"- **⚠️ 报告不完整**: {run_stats['incomplete']}，只包含出错前的任务")
+    if cache_stats is not None:
+        lines.append(
+            f"- **工具结果缓存**: 命中 {cache_stats['hits']} / 未命中 {cache_stats['misses']}"
+            f" ({cache_stats['hit_rate'] * 100:.1f}%)"
+        )
+    if policy_stats is not None:
+        lines.append(
+            f"- **工具调用超时/重试**: 超时 {policy_stats['timeouts']}，重试 {policy_stats['retries']}，"
+            f"对冲 {policy_stats['hedged']}（对冲请求胜出 {policy_stats['hedge_wins']}）"
+        )
+    if context_stats is not None:
+        lines.append(
+            f"- **上下文控制**: 截断超长工具结果 {context_stats['truncated']} 个，"
+            f"省略较早的工具结果 {context_stats['elided']} 个"
+        )
+    if scheduler_stats is not None:
+        lines.append(render_scheduler_stats(scheduler_stats))
+
+    header = "\n# 评估报告\n\n## 摘要\n\n" + "\n".join(lines) + "\n"
+    if run_stats is not None:
+        header += "\n" + render_performance(results, run_stats)
+    return header + "\n---\n"
+
+
+def render_task(index: int, result: dict[str, Any]) -> str:
+    """渲染单个任务的报告段落；结果带有 index 时按其在评估文件中的位置编号。"""
+    model_calls = result.get("model_calls") or {}
+    if result.get("index") is not None:
+        index = result["index"]
+    scorer_error = f"**评分出错**: {result['scorer_error']}\n" if result.get("scorer_error") else ""
+    return f"""
+### 任务 {index + 1}
+
+**问题**: {result["question"]}
+**预期答案**: `{result["expected"]}`
+**实际答案**: `{result["actual"] or "N/A"}`
+**正确**: {"✅" if result["score"] else "❌"}
+{scorer_error}**耗时**: {result["total_duration"]:.1f}s，令牌：输入 {model_calls.get("input_tokens", 0)} / 输出 {model_calls.get("output_tokens", 0)}
+**每轮提示大小**: {" → ".join(str(t) for t in model_calls.get("prompt_tokens", [])) or "N/A"}
+
+---
+"""
+
+
+def render_report(
+    results: list[dict[str, Any]],
+    cache_stats: dict[str, Any] | None = None,
+    run_stats: dict[str, Any] | None = None,
+    policy_stats: dict[str, Any] | None = None,
+    context_stats: dict[str, Any] | None = None,
+    scheduler_stats: dict[str, Any] | None = None,
+) -> str:
+    """一次性渲染完整的 Markdown 报告。"""
+    return render_summary(results, cache_stats, run_stats, policy_stats, context_stats, scheduler_stats) + "".join(
+        render_task(i, result) for i, result in enumerate(results)
+    )
+
+
+def token_cost(model_calls: list[dict[str, Any]], price: tuple[float, float]) -> float:
+    """按每百万令牌的 (输入, 输出) 美元单价估算成本。
+
+    缓存读取按输入单价的 0.1 倍、缓存写入按 1.25 倍计算。
+    """
+    input_price, output_price = price
+    input_tokens = sum(
+        m.get("input_tokens", 0)
+        + 0.1 * m.get("cache_read_input_tokens", 0)
+        + 1.25 * m.get("cache_creation_input_tokens", 0)
+        for m in model_calls
+    )
+    output_tokens = sum(m.get("output_tokens", 0) for m in model_calls)
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+def render_matrix(
+    runs: list[dict[str, Any]],
+    cache_stats: dict[str, Any] | None = None,
+    policy_stats: dict[str, Any] | None = None,
+    prices: dict[str, tuple[float, float]] | None = None,
+    scheduler_stats: dict[str, Any] | None = None,
+) -> str:
+    """渲染多个模型/系统提示组合的对比报告。
+
+    runs 中每项包含 name、model、results 和 run_stats；prices 按模型给出每百万
+    令牌的 (输入, 输出) 单价，提供时附带成本列。
+    """
+    prices = prices or {}
+    lines = [
+        "\n# 矩阵评估报告\n",
+        "## 对比\n",
+        "| 组合 | 准确率 | 任务 p50 (s) | 任务 p90 (s) | 模型调用 p50 (s) | 输入令牌 | 输出令牌 | 每任务令牌 | 成本 (USD) |",
+        "|---|---|---|---|---|---|---|---|---|",
+    ]
+    for run in runs:
+        results = run["results"]
+        correct = sum(r["score"] for r in results)
+        accuracy = correct / len(results) * 100 if results else 0
+        task_durations = [r["total_duration"] for r in results]
+        model_calls = [r.get("model_calls") or {} for r in results]
+        model_durations = [d for m in model_calls for d in m.get("durations", [])]
+        input_tokens = sum(m.get("input_tokens", 0) for m in model_calls)
+        output_tokens = sum(m.get("output_tokens", 0) for m in model_calls)
+        per_task = (input_tokens + output_tokens) / len(results) if results else 0
+        price = prices.get(run["model"])
+        cost = f"{token_cost(model_calls, price):.4f}" if price else "N/A"
+        lines.append(
+            f"| {run['name']} | {correct}/{len(results)} ({accuracy:.1f}%) "
+            f"| {percentile(task_durations, 50):.1f} | {percentile(task_durations, 90):.1f} "
+            f"| {percentile(model_durations, 50):.2f} | {input_tokens} | {output_tokens} | {per_task:.0f} | {cost} |"
+        )
+
+    lines.append("")
+    if cache_stats is not None:
+        lines.append(
+            f"- **工具结果缓存（所有组合共享）**: 命中 {cache_stats['hits']} / 未命中 {cache_stats['misses']}"
+            f" ({cache_stats['hit_rate'] * 100:.1f}%)"
+        )
+    if policy_stats is not None:
+        lines.append(
+            f"- **工具调用超时/重试**: 超时 {policy_stats['timeouts']}，重试 {policy_stats['retries']}，"
+            f"对冲 {policy_stats['hedged']}（对冲请求胜出 {policy_stats['hedge_wins']}）"
+        )
+    if scheduler_stats is not None:
+        lines.append(render_scheduler_stats(scheduler_stats))
+    for run in runs:
+        if run["run_stats"].get("incomplete"):
+            lines.append(f"- **⚠️ {run['name']} 不完整**: {run['run_stats']['incomplete']}，只包含出错前的任务")
+
+    # 逐任务对比：按任务在评估文件中的位置对齐各组合的结果
+    by_index: dict[int, dict[str, Any]] = {}
+    for run in runs:
+        for position, result in enumerate(run["results"]):
+            index = result.get("index", position)
+            by_index.setdefault(index, {})[run["name"]] = result
+    lines += [
+        "\n## 逐任务对比\n",
+        "| 任务 | " + " | ".join(run["name"] for run in runs) + " |",
+        "|---|" + "---|" * len(runs),
+    ]
+    for index in sorted(by_index):
+        cells = []
+        for run in runs:
+            result = by_index[index].get(run["name"])
+            cells.append("-" if result is None else f"{'✅' if result['score'] else '❌'} {result['total_duration']:.1f}s")
+        lines.append(f"| {index + 1} | " + " | ".join(cells) + " |")
+    return "\n".join(lines) + "\n"
+
+
+class ReportWriter:
+    """在任务完成时增量写入报告。
+
+    Markdown 任务段落按原始任务顺序写入 <output>.partial：任务完成后，只要它
+    之前的任务都已完成就立即落盘。JSONL 和 CSV 副本（<output 主名>.results.jsonl/.csv，
+    不会与 run.jsonl 这样的检查点重名）按完成顺序立即写入，并带有 index 列。
+    finish() 时把摘要头部写在最前面，生成最终的 Markdown 文件。
+
+    文件在第一次写入时才创建，因此可以在读取检查点之前构造。
+    """
+
+    def __init__(self, output: Path):
+        self.output = Path(output)
+        self.partial_path = self.output.with_name(self.output.name + ".partial")
+        self.jsonl_path = self.output.with_name(self.output.stem + ".results.jsonl")
+        self.csv_path = self.output.with_name(self.output.stem + ".results.csv")
+        self._opened = False
+        self._next_index = 0
+        self._waiting: dict[int, dict[str, Any]] = {}
+
+    @property
+    def paths(self) -> list[Path]:
+        return [self.output, self.partial_path, self.jsonl_path, self.csv_path]
+
+    def _open(self):
+        if self._opened:
+            return
+        self.output.parent.mkdir(parents=True, exist_ok=True)
+        self._body = self.partial_path.open("w", encoding="utf-8")
+        self._jsonl = self.jsonl_path.open("w", encoding="utf-8")
+        self._csv_file = self.csv_path.open("w", encoding="utf-8", newline="")
+        self._csv = csv.DictWriter(self._csv_file, fieldnames=CSV_FIELDS)
+        self._csv.writeheader()
+        self._opened = True
+
+    def add(self, index: int, result: dict[str, Any]):
+        """记录一个已完成的任务；index 是任务在本次运行中的顺序。"""
+        self._open()
+        self._jsonl.write(json.dumps({"index": index, **result}, ensure_ascii=False) + "\n")
+        self._jsonl.flush()
+        self._csv.writerow({
+            "index": result.get("index", index),
+            "task_id": result.get("task_id"),
+            "question": result["question"],
+            "expected": result["expected"],
+            "actual": result["actual"],
+            "score": result["score"],
+            "total_duration": f"{result['total_duration']:.3f}",
+            "tool_calls": sum(len(m["durations"]) for m in result["tool_calls"].values()),
+            "input_tokens": (result.get("model_calls") or {}).get("input_tokens", 0),
+            "output_tokens": (result.get("model_calls") or {}).get("output_tokens", 0),
+        })
+        self._csv_file.flush()
+
+        self._waiting[index] = result
+        while self._next_index in self._waiting:
+            self._body.write(render_task(self._next_index, self._waiting.pop(self._next_index)))
+            self._next_index += 1
+        self._body.flush()
+
+    def finish(self, summary: str):
+        """写入摘要头部并生成最终报告文件。"""
+        self._open()
+        self.close()
+        with self.output.open("w", encoding="utf-8") as out, self.partial_path.open(encoding="utf-8") as body:
+            out.write(summary)
+            while chunk := body.read(1 << 16):
+                out.write(chunk)
+        os.remove(self.partial_path)
+
+    def close(self):
+        if not self._opened:
+            return
+        for f in (self._body, self._jsonl, self._csv_file):
+            if not f.closed:
+                f.close()
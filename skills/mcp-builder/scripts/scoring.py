@@ -0,0 +1,145 @@
+"""答案评分器。
+
+评分器规格写作 "名称" 或 "名称:选项"，可以在评估文件中按任务指定，也可以用
+--scorer 设置默认值：
+
+    exact                   与预期答案完全相同（默认）
+    normalized              忽略大小写、全半角、首尾空白、引号和结尾句号后比较
+    numeric[:容差]          按数值比较，忽略千位分隔符、货币符号和百分号；
+                            容差可以是绝对值（0.01）或相对值（0.1%）
+    regex[:i]               预期答案是正则表达式，需要完整匹配实际答案；i 表示忽略大小写
+    set[:分隔符]            按分隔符（默认逗号、顿号或分号）拆分后比较集合，忽略顺序
+    python:模块:函数        自定义评分函数 fn(actual, expected) -> bool，模块可以是
+                            可导入的模块名或 .py 文件路径
+"""
+
+import importlib
+import importlib.util
+import math
+import re
+import unicodedata
+from pathlib import Path
+from typing import Any, Callable
+
+Scorer = Callable[[str, str, str | None], bool]
+
+SCORERS: dict[str, Scorer] = {}
+
+_custom_scorers: dict[str, Callable[[str, str], Any]] = {}
+
+
+def register_scorer(name: str):
+    """注册评分器的装饰器，评分函数签名为 fn(actual, expected, option) -> bool。"""
+
+    def decorator(func: Scorer) -> Scorer:
+        SCORERS[name] = func
+        return func
+
+    return decorator
+
+
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).casefold().strip()
+    text = re.sub(r"\s+", " ", text)
+    text = text.strip("\"'`“”‘’")
+    return text.rstrip(".。")
+
+
+def parse_number(text: str) -> float | None:
+    """把 "11,614.72"、"$1 200"、"12.5%" 等写法解析为数值，无法解析时返回 None。"""
+    cleaned = unicodedata.normalize("NFKC", text).strip()
+    cleaned = re.sub(r"[,_\s]", "", cleaned)
+    cleaned = cleaned.lstrip("$€£¥").rstrip("%")
+    try:
+        return float(cleaned)
+    except ValueError:
+        return None
+
+
+@register_scorer("exact")
+def exact(actual: str, expected: str, option: str | None) -> bool:
+    return actual == expected
+
+
+@register_scorer("normalized")
+def normalized(actual: str, expected: str, option: str | None) -> bool:
+    return normalize_text(actual) == normalize_text(expected)
+
+
+@register_scorer("numeric")
+def numeric(actual: str, expected: str, option: str | None) -> bool:
+    actual_value, expected_value = parse_number(actual), parse_number(expected)
+    if actual_value is None or expected_value is None:
+        return False
+    if not option:
+        return math.isclose(actual_value, expected_value, rel_tol=1e-9, abs_tol=1e-9)
+    if option.endswith("%"):
+        return math.isclose(actual_value, expected_value, rel_tol=float(option[:-1]) / 100)
+    return abs(actual_value - expected_value) <= float(option)
+
+
+@register_scorer("regex")
+def regex(actual: str, expected: str, option: str | None) -> bool:
+    flags = re.DOTALL | (re.IGNORECASE if option and "i" in option else 0)
+    return re.fullmatch(expected, actual.strip(), flags) is not None
+
+
+@register_scorer("set")
+def set_equal(actual: str, expected: str, option: str | None) -> bool:
+    separator = re.escape(option) if option else r"[,，、;；]"
+
+    def items(text: str) -> set[str]:
+        return {normalize_text(item) for item in re.split(separator, text) if item.strip()}
+
+    return items(actual) == items(expected)
+
+
+def _load_custom_scorer(target: str) -> Callable[[str, str], Any]:
+    if target in _custom_scorers:
+        return _custom_scorers[target]
+    module_name, sep, func_name = target.rpartition(":")
+    if not sep or not module_name or not func_name:
+        raise ValueError(f"自定义评分器格式应为 python:模块:函数：{target}")
+    if module_name.endswith(".py"):
+        path = Path(module_name)
+        spec = importlib.util.spec_from_file_location(path.stem, path)
+        if spec is None or spec.loader is None:
+            raise ValueError(f"无法加载评分器模块：{module_name}")
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(module_name)
+    func = getattr(module, func_name, None)
+    if not callable(func):
+        raise ValueError(f"模块 {module_name} 中没有可调用的 {func_name}")
+    _custom_scorers[target] = func
+    return func
+
+
+def resolve_scorer(spec: str) -> Callable[[str, str], bool]:
+    """把评分器规格解析为 fn(actual, expected) -> bool，规格无效时抛出 ValueError。"""
+    name, _, option = spec.strip().partition(":")
+    if name == "python":
+        func = _load_custom_scorer(option)
+        return lambda actual, expected: bool(func(actual, expected))
+    scorer = SCORERS.get(name)
+    if scorer is None:
+        raise ValueError(f"未知的评分器：{name}（可选：{', '.join(sorted(SCORERS))}、python）")
+    return lambda actual, expected: scorer(actual, expected, option or None)
+
+
+def score_answer(actual: str | None, expected: str, spec: str = "exact") -> int:
+    """按评分器规格给实际答案打分，返回 1（正确）或 0；没有答案时为 0。"""
+    if not actual:
+        return 0
+    return int(resolve_scorer(spec)(actual, expected))
+
+
+def try_score_answer(actual: str | None, expected: str, spec: str = "exact") -> tuple[int, str | None]:
+    """与 score_answer 相同，但评分器规格无效、预期答案不是有效的正则表达式或自定义
+    评分函数出错时不抛出异常，而是返回 (0, 错误消息)；正常时错误消息为 None。
+    """
+    try:
+        return score_answer(actual, expected, spec), None
+    except Exception as e:
+        return 0, f"评分器 {spec} 出错：{type(e).__name__}: {e}"
@@ -0,0 +1,221 @@
+"""MCP 工具调用结果和工具目录的缓存。
+
+ToolResultCache 只缓存允许列表中的（只读）工具，缓存键由工具名和规范化后的
+参数组成，条目受 TTL 和 LRU 容量限制。ToolCatalogCache 按服务器标识缓存
+list_tools 的结果。两者都可持久化到磁盘供后续运行复用。
+"""
+
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+
+def to_jsonable(value: Any) -> Any:
+    """将工具结果（可能包含 pydantic 模型）转换为可 JSON 序列化的数据。"""
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json", exclude_none=True)
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(v) for v in value]
+    if isinstance(value, dict):
+        return {k: to_jsonable(v) for k, v in value.items()}
+    return value
+
+
+class ToolResultCache:
+    """带 TTL 和 LRU 淘汰的工具结果缓存。
+
+    参数：
+        tools: 可缓存的工具名集合；包含 "*" 时缓存所有工具
+        ttl: 条目的有效期（秒）
+        max_entries: 最多保留的条目数，超出时淘汰最久未使用的条目
+        path: 可选的 JSON 持久化文件路径
+    """
+
+    def __init__(
+        self,
+        tools: set[str] | list[str],
+        ttl: float = 3600.0,
+        max_entries: int = 1024,
+        path: Path | None = None,
+    ):
+        self.tools = set(tools)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = Path(path) if path else None
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        if self.path and self.path.exists():
+            self.load()
+
+    def is_cacheable(self, tool_name: str) -> bool:
+        return "*" in self.tools or tool_name in self.tools
+
+    @staticmethod
+    def make_key(tool_name: str, arguments: dict[str, Any] | None) -> str:
+        """生成与参数顺序和空白无关的缓存键。"""
+        canonical = json.dumps(arguments or {}, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return f"{tool_name}:{canonical}"
+
+    def get(self, key: str) -> tuple[bool, Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def put(self, key: str, value: Any):
+        self._entries[key] = (time.time() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def call(
+        self,
+        tool_name: str,
+        arguments: dict[str, Any],
+        fetch: Callable[[str, dict[str, Any]], Awaitable[Any]],
+    ) -> Any:
+        """通过缓存调用工具。
+
+        fetch 返回完整的 CallToolResult；出错的结果不会被缓存。缓存中保存可 JSON
+        序列化的形式以便持久化，调用方（execute_tool）负责统一序列化返回值。
+        """
+        if not self.is_cacheable(tool_name):
+            return (await fetch(tool_name, arguments)).content
+
+        key = self.make_key(tool_name, arguments)
+        found, value = self.get(key)
+        if found:
+            self.hits += 1
+            return value
+
+        # 相同的并发调用只向服务器发送一次
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.hits += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await fetch(tool_name, arguments)
+            value = to_jsonable(result.content)
+            if not getattr(result, "isError", False):
+                self.put(key, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            # 避免没有等待者时出现 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def stats(self) -> dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+        }
+
+    def load(self):
+        """从磁盘加载未过期的条目。"""
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 无法读取工具缓存 {self.path}：{e}")
+            return
+        now = time.time()
+        for key, (expires_at, value) in data.get("entries", {}).items():
+            if expires_at >= now:
+                self._entries[key] = (expires_at, value)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def save(self):
+        """将条目原子地写入磁盘。"""
+        if not self.path:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp_path.write_text(
+            json.dumps({"entries": dict(self._entries)}, ensure_ascii=False),
+            encoding="utf-8",
+        )
+        os.replace(tmp_path, self.path)
+
+
+class ToolCatalogCache:
+    """按服务器标识缓存 list_tools 返回的工具目录。
+
+    服务器标识由传输类型加 command+args 或 URL 组成。每个条目记录服务器在
+    initialize 时报告的名称和版本作为指纹：指纹一致且未超过 max_age 时直接
+    复用缓存的工具目录，否则重新调用 list_tools。同一个实例可由连接池中的所有
+    会话共享，并可持久化到磁盘供后续运行复用。
+    """
+
+    def __init__(self, path: Path | None = None, max_age: float = 86400.0):
+        self.path = Path(path) if path else None
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._entries: dict[str, dict[str, Any]] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+        if self.path and self.path.exists():
+            self.load()
+
+    async def get_or_fetch(
+        self,
+        server_key: str,
+        fingerprint: str | None,
+        fetch: Callable[[], Awaitable[list[dict[str, Any]]]],
+    ) -> list[dict[str, Any]]:
+        """返回缓存的工具目录，指纹不一致或已过期时调用 fetch 刷新。"""
+        lock = self._locks.setdefault(server_key, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(server_key)
+            if (
+                entry is not None
+                and fingerprint is not None
+                and entry["fingerprint"] == fingerprint
+                and time.time() - entry["fetched_at"] <= self.max_age
+            ):
+                self.hits += 1
+                return entry["tools"]
+
+            self.misses += 1
+            tools = to_jsonable(await fetch())
+            self._entries[server_key] = {
+                "fingerprint": fingerprint,
+                "fetched_at": time.time(),
+                "tools": tools,
+            }
+            return tools
+
+    def load(self):
+        try:
+            self._entries = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 无法读取工具目录缓存 {self.path}：{e}")
+
+    def save(self):
+        if not self.path:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp_path.write_text(json.dumps(self._entries, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,156 @@
+"""评估运行的可选 span 追踪。
+
+默认不记录任何内容。调用 set_tracer(Tracer()) 后，span() 记录带父子关系的
+耗时区间（父 span 通过 contextvars 在 asyncio 任务之间传递），运行结束时用
+Tracer.export() 写入本地文件：
+
+- chrome：Chrome 追踪事件 JSON，可以在 Perfetto（ui.perfetto.dev）或
+  chrome://tracing 中打开，每个评估任务一行
+- otlp：OTLP/JSON（resourceSpans），可以导入 Jaeger 等支持 OTLP 的工具
+"""
+
+import contextvars
+import json
+import os
+import secrets
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, Iterator
+
+SERVICE_NAME = "mcp-evaluation"
+
+_current_span: contextvars.ContextVar["Span | None"] = contextvars.ContextVar("current_span", default=None)
+_tracer: "Tracer | None" = None
+
+
+class Span:
+    """一个已开始的耗时区间。"""
+
+    def __init__(self, name: str, parent: "Span | None", attributes: dict[str, Any]):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        # 同一棵 span 树共用根 span 的轨道，Chrome 格式中按它分行显示
+        self.track = parent.track if parent else self.span_id
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: int | None = None
+        self.error: str | None = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+
+class _NoopSpan:
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """在内存中收集已结束的 span，并导出为 Chrome 追踪或 OTLP/JSON 文件。"""
+
+    def __init__(self):
+        self.spans: list[Span] = []
+        self._tracks: dict[str, int] = {}
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        span = Span(name, _current_span.get(), attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            _current_span.reset(token)
+            self.spans.append(span)
+
+    def _chrome_events(self) -> list[dict[str, Any]]:
+        events = []
+        for span in sorted(self.spans, key=lambda s: s.start_ns):
+            tid = self._tracks.setdefault(span.track, len(self._tracks) + 1)
+            args = {k: _jsonable(v) for k, v in span.attributes.items()}
+            if span.error:
+                args["error"] = span.error
+            events.append({
+                "name": span.name,
+                "cat": span.name.split(".", 1)[0],
+                "ph": "X",
+                "ts": span.start_ns / 1000,
+                "dur": (span.end_ns - span.start_ns) / 1000,
+                "pid": 1,
+                "tid": tid,
+                "args": args,
+            })
+        return events
+
+    def _otlp_spans(self) -> list[dict[str, Any]]:
+        spans = []
+        for span in self.spans:
+            record = {
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": [_otlp_attribute(k, v) for k, v in span.attributes.items()],
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            }
+            if span.parent_id:
+                record["parentSpanId"] = span.parent_id
+            spans.append(record)
+        return spans
+
+    def export(self, path: Path, format: str = "chrome"):
+        """把已结束的 span 原子地写入 path。"""
+        if format == "otlp":
+            data = {
+                "resourceSpans": [{
+                    "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+                    "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": self._otlp_spans()}],
+                }]
+            }
+        else:
+            data = {"traceEvents": self._chrome_events(), "displayTimeUnit": "ms"}
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        tmp_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+
+def _jsonable(value: Any) -> Any:
+    return value if isinstance(value, (str, int, float, bool)) or value is None else str(value)
+
+
+def _otlp_attribute(key: str, value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+def set_tracer(tracer: Tracer | None):
+    """启用（或用 None 关闭）全局追踪。"""
+    global _tracer
+    _tracer = tracer
+
+
+def span(name: str, **attributes: Any):
+    """在当前 span 下开始一个子 span；未启用追踪时不做任何事。"""
+    if _tracer is None:
+        return nullcontext(_NOOP_SPAN)
+    return _tracer.span(name, **attributes)
@@ -3,46 +3,406 @@
 技能打包器 - 将技能文件夹创建为可分发的 .skill 文件
 
 用法：
-    python utils/package_skill.py <path/to/skill-folder> [output-directory]
+    python utils/package_skill.py <path/to/skill-folder> [output-directory] [--incremental] [--deterministic]
+                                  [--max-file-size SIZE] [--max-total-size SIZE]
+    python utils/package_skill.py --all <root> [output-directory] [--incremental] [--deterministic] [-j JOBS]
 
 示例：
     python utils/package_skill.py skills/public/my-skill
     python utils/package_skill.py skills/public/my-skill ./dist
+    python utils/package_skill.py skills/public/my-skill ./dist --incremental
+    python utils/package_skill.py --all skills ./dist
+
+每个 .skill 文件都包含一份内容哈希清单（<技能名>/.skill-manifest.json）。
+--incremental 模式读取已有 .skill 文件中的清单：内容没有变化时跳过打包，
+否则只重新压缩变化的文件，未变化的条目直接复制已压缩的数据。
+
+--deterministic 模式生成可复现的归档：条目按路径排序，时间戳固定（设置了
+SOURCE_DATE_EPOCH 时使用该时间，否则为 1980-01-01），权限统一为 644/755，
+相同的输入总是得到字节完全相同的 .skill 文件。打包完成后输出归档的 SHA-256。
+
+技能文件夹中的 .skillignore（gitignore 语法）可以排除不需要分发的文件；
+__pycache__、.git、编辑器交换文件等默认排除，可以在 .skillignore 中用 ! 重新包含。
+--max-file-size 和 --max-total-size 设置单个文件和总大小（未压缩）的预算，
+超出时打包失败并列出最大的文件。
+
+--all 模式查找 <root> 下所有包含 SKILL.md 的目录，用进程池并行验证和打包，
+最后输出每个技能的大小和耗时；任何技能失败时以非零状态退出。
 """
 
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import struct
 import sys
+import time
 import zipfile
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from quick_validate import validate_skill
+from quick_validate import find_skills, validate_skill
+
+MANIFEST_NAME = ".skill-manifest.json"
+
+# 本身已经压缩过的格式，再用 deflate 压缩几乎没有收益，直接存储
+STORED_SUFFIXES = {
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".ico",
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".skill",
+    ".docx", ".xlsx", ".pptx", ".pdf",
+    ".mp3", ".mp4", ".mov", ".ogg", ".webm",
+    ".woff", ".woff2",
+}
+
+
+IGNORE_FILE = ".skillignore"
+
+# 默认排除的文件，写在 .skillignore 之前，可以用 ! 规则重新包含
+DEFAULT_EXCLUDES = [
+    "__pycache__/",
+    "*.py[cod]",
+    ".git/",
+    ".hg/",
+    ".svn/",
+    ".idea/",
+    ".vscode/",
+    ".DS_Store",
+    "Thumbs.db",
+    "*.swp",
+    "*.swo",
+    "*~",
+    ".#*",
+    f"/{IGNORE_FILE}",
+    f"/{MANIFEST_NAME}",
+]
+
+SIZE_UNITS = {"": 1, "B": 1, "K": 1024, "KB": 1024, "M": 1024 ** 2, "MB": 1024 ** 2, "G": 1024 ** 3, "GB": 1024 ** 3}
+
+# 超出总大小预算时列出的最大文件数
+LARGEST_OFFENDERS = 10
+
+# zip 格式能表示的最早时间
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+
+def fixed_date_time():
+    """确定性模式使用的条目时间戳：SOURCE_DATE_EPOCH（UTC）或 1980-01-01。"""
+    epoch = os.environ.get("SOURCE_DATE_EPOCH")
+    if not epoch:
+        return ZIP_EPOCH
+    return max(ZIP_EPOCH, time.gmtime(int(epoch))[:6])
+
+
+def normalized_mode(file_path):
+    """确定性模式下的文件权限：可执行文件为 755，其余为 644。"""
+    return 0o755 if file_path is not None and os.access(file_path, os.X_OK) else 0o644
+
+
+def _glob_to_regex(pattern):
+    """把 gitignore 的通配符模式转换为正则表达式（不含锚点）。"""
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+            continue
+        if pattern.startswith("/**", i) and i + 3 == len(pattern):
+            regex += "/.*"
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+            continue
+        if c == "*":
+            regex += "[^/]*"
+        elif c == "?":
+            regex += "[^/]"
+        elif c == "[":
+            end = pattern.find("]", i + 2)
+            if end == -1:
+                regex += re.escape(c)
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                regex += f"[{body}]"
+                i = end
+        elif c == "\\" and i + 1 < len(pattern):
+            i += 1
+            regex += re.escape(pattern[i])
+        else:
+            regex += re.escape(c)
+        i += 1
+    return regex
+
+
+class SkillIgnore:
+    """
+    gitignore 语法的排除规则。
+
+    支持注释、! 取反、结尾的 / 只匹配目录、包含 / 的模式相对技能根目录匹配，
+    以及 *、?、[...] 和 ** 通配符。后出现的规则优先。
+    """
+
+    def __init__(self, lines):
+        self.rules = []
+        for line in lines:
+            line = line.rstrip("\n")
+            if not line.strip() or line.startswith("#"):
+                continue
+            line = re.sub(r"(?<!\\)\s+$", "", line)
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            elif line.startswith("\\!") or line.startswith("\\#"):
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            if not line:
+                continue
+            anchored = "/" in line
+            body = _glob_to_regex(line.lstrip("/"))
+            regex = f"^{body}$" if anchored else f"^(?:.*/)?{body}$"
+            self.rules.append((re.compile(regex), negate, dir_only))
+
+    @classmethod
+    def for_skill(cls, skill_path):
+        """默认排除规则加上技能文件夹中 .skillignore 的规则。"""
+        lines = list(DEFAULT_EXCLUDES)
+        ignore_file = Path(skill_path) / IGNORE_FILE
+        if ignore_file.exists():
+            lines += ignore_file.read_text(encoding='utf-8').splitlines()
+        return cls(lines)
+
+    def is_ignored(self, rel_path, is_dir=False):
+        """rel_path 是相对技能根目录、以 / 分隔的路径。"""
+        ignored = False
+        for regex, negate, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel_path):
+                ignored = not negate
+        return ignored
+
+
+def list_skill_files(skill_path, ignore=None):
+    """
+    按路径顺序列出需要打包的文件。
+
+    被排除的目录不再进入（与 git 相同，其中的文件无法再被重新包含）。
+    """
+    ignore = ignore or SkillIgnore.for_skill(skill_path)
+    files = []
+    for dirpath, dirnames, filenames in os.walk(skill_path):
+        rel_dir = Path(dirpath).relative_to(skill_path).as_posix()
+        prefix = "" if rel_dir == "." else rel_dir + "/"
+        dirnames[:] = sorted(d for d in dirnames if not ignore.is_ignored(prefix + d, is_dir=True))
+        for filename in filenames:
+            if not ignore.is_ignored(prefix + filename):
+                files.append(Path(dirpath) / filename)
+    return sorted(files)
+
+
+def parse_size(value):
+    """解析 "500KB"、"10MB"、"1048576" 形式的大小，返回字节数。"""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMG]?B?)\s*", value.upper())
+    if not match:
+        raise argparse.ArgumentTypeError(f"无效的大小：{value}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+def check_size_budget(skill_path, file_paths, max_file_size=None, max_total_size=None):
+    """
+    检查单个文件和总大小（未压缩）是否超出预算。
+
+    返回：
+        描述超出项的行列表，没有超出时为空列表
+    """
+    sizes = sorted(((f.stat().st_size, f) for f in file_paths), key=lambda item: item[0], reverse=True)
+    problems = []
+    if max_file_size is not None:
+        for size, file_path in sizes:
+            if size > max_file_size:
+                problems.append(f"  {format_size(size):>10}  {file_path.relative_to(skill_path)}（超过单文件上限 {format_size(max_file_size)}）")
+    total = sum(size for size, _ in sizes)
+    if max_total_size is not None and total > max_total_size:
+        problems.append(f"  总大小 {format_size(total)} 超过上限 {format_size(max_total_size)}，最大的文件：")
+        for size, file_path in sizes[:LARGEST_OFFENDERS]:
+            problems.append(f"  {format_size(size):>10}  {file_path.relative_to(skill_path)}")
+    return problems
+
+
+def file_sha256(file_path):
+    """计算文件内容的 SHA-256。"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def compression_for(file_path):
+    """已压缩的格式使用 ZIP_STORED，其余使用 ZIP_DEFLATED。"""
+    return zipfile.ZIP_STORED if file_path.suffix.lower() in STORED_SUFFIXES else zipfile.ZIP_DEFLATED
+
+
+def build_manifest(skill_path, file_paths):
+    """
+    计算要打包的每个文件的内容哈希和权限。
+
+    权限记录为确定性模式使用的 644/755，仅 chmod +x 也会使条目变化而被重新打包。
+
+    返回：
+        (manifest, files)：manifest 是写入 .skill 的清单字典，
+        files 是按 zip 内路径索引的源文件路径
+    """
+    entries = {}
+    files = {}
+    for file_path in file_paths:
+        arcname = file_path.relative_to(skill_path.parent).as_posix()
+        entries[arcname] = {
+            "sha256": file_sha256(file_path),
+            "size": file_path.stat().st_size,
+            "mode": normalized_mode(file_path),
+        }
+        files[arcname] = file_path
+    return {"version": 2, "files": entries}, files
+
 
+def read_manifest(skill_filename, skill_name):
+    """读取已有 .skill 文件中的清单；文件不存在或没有有效清单时返回 None。"""
+    try:
+        with zipfile.ZipFile(skill_filename) as zipf:
+            return json.loads(zipf.read(f"{skill_name}/{MANIFEST_NAME}"))
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return None
+
+
+# 原样复制条目依赖的 zipfile 内部接口，已在 CPython 3.10-3.13 上验证
+_RAW_COPY_MODULE_ATTRS = ("structFileHeader", "sizeFileHeader", "_FH_FILENAME_LENGTH", "_FH_EXTRA_FIELD_LENGTH")
+_RAW_COPY_ZIPFILE_ATTRS = ("fp", "filelist", "NameToInfo", "start_dir", "_didModify", "_writecheck")
+
+
+def raw_copy_supported(source, target):
+    """当前 Python 的 zipfile 是否提供原样复制所需的内部接口。"""
+    return (
+        all(hasattr(zipfile, name) for name in _RAW_COPY_MODULE_ATTRS)
+        and hasattr(source, "fp")
+        and all(hasattr(target, name) for name in _RAW_COPY_ZIPFILE_ATTRS)
+    )
+
+
+def copy_compressed_entry(source, target, info, date_time=None, mode=None):
+    """
+    把 source 中的一个条目按原样（不解压、不重新压缩）复制到 target。
+
+    zipfile 没有公开复制原始压缩数据的接口，这里按 zip 格式读取本地文件头之后的
+    压缩数据，并写入新的本地文件头。提供 date_time 和 mode 时替换条目的时间戳和权限。
+    其他 Python 版本缺少所需的内部接口时，退回到解压后重新压缩，结果内容相同。
+    """
+    copied = zipfile.ZipInfo(info.filename, date_time or info.date_time)
+    copied.compress_type = info.compress_type
+    if mode is None:
+        copied.external_attr = info.external_attr
+        copied.create_system = info.create_system
+    else:
+        copied.external_attr = (0o100000 | mode) << 16
+        copied.create_system = 3
+
+    if not raw_copy_supported(source, target):
+        target.writestr(copied, source.read(info))
+        return
 
-def package_skill(skill_path, output_dir=None):
+    source.fp.seek(info.header_offset)
+    header = struct.unpack(zipfile.structFileHeader, source.fp.read(zipfile.sizeFileHeader))
+    source.fp.seek(
+        info.header_offset + zipfile.sizeFileHeader
+        + header[zipfile._FH_FILENAME_LENGTH] + header[zipfile._FH_EXTRA_FIELD_LENGTH]
+    )
+    data = source.fp.read(info.compress_size)
+
+    copied.CRC = info.CRC
+    copied.compress_size = info.compress_size
+    copied.file_size = info.file_size
+
+    target._writecheck(copied)
+    target._didModify = True
+    copied.header_offset = target.fp.tell()
+    zip64 = copied.file_size > zipfile.ZIP64_LIMIT or copied.compress_size > zipfile.ZIP64_LIMIT
+    target.fp.write(copied.FileHeader(zip64))
+    target.fp.write(data)
+    target.filelist.append(copied)
+    target.NameToInfo[copied.filename] = copied
+    target.start_dir = target.fp.tell()
+
+
+def deterministic_info(arcname, file_path, date_time):
+    """生成时间戳和权限固定的 ZipInfo。"""
+    info = zipfile.ZipInfo(arcname, date_time)
+    info.external_attr = (0o100000 | normalized_mode(file_path)) << 16
+    info.create_system = 3
+    info.compress_type = compression_for(Path(arcname))
+    return info
+
+
+def package_skill(
+    skill_path, output_dir=None, incremental=False, deterministic=False, max_file_size=None, max_total_size=None
+):
     """
     将技能文件夹打包成 .skill 文件。
 
     参数：
         skill_path: 技能文件夹路径
         output_dir: .skill 文件的可选输出目录（默认为当前目录）
+        incremental: 为 True 时与已有 .skill 文件的清单比较，内容未变化则跳过打包，
+            否则只重新压缩变化的文件
+        deterministic: 为 True 时生成可复现的归档（固定时间戳和权限）
+        max_file_size: 单个文件的大小上限（字节），None 表示不限制
+        max_total_size: 所有文件的总大小上限（字节），None 表示不限制
 
     返回：
         创建的 .skill 文件路径，如果出错则返回 None
     """
+    path, _, _ = _package_skill(
+        skill_path, output_dir, incremental, deterministic, max_file_size, max_total_size
+    )
+    return path
+
+
+def _package_skill(
+    skill_path, output_dir=None, incremental=False, deterministic=False, max_file_size=None, max_total_size=None
+):
+    """
+    package_skill 的实现，stdout 只用于给人看的日志。
+
+    返回：
+        (路径, 是否因内容未变化而跳过, 错误消息)；出错时路径为 None
+    """
     skill_path = Path(skill_path).resolve()
 
     # 验证技能文件夹存在
     if not skill_path.exists():
-        print(f"❌ 错误：未找到技能文件夹：{skill_path}")
-        return None
+        error = f"错误：未找到技能文件夹：{skill_path}"
+        print(f"❌ {error}")
+        return None, False, error
 
     if not skill_path.is_dir():
-        print(f"❌ 错误：路径不是目录：{skill_path}")
-        return None
+        error = f"错误：路径不是目录：{skill_path}"
+        print(f"❌ {error}")
+        return None, False, error
 
     # 验证 SKILL.md 存在
     skill_md = skill_path / "SKILL.md"
     if not skill_md.exists():
-        print(f"❌ 错误：在 {skill_path} 中未找到 SKILL.md")
-        return None
+        error = f"错误：在 {skill_path} 中未找到 SKILL.md"
+        print(f"❌ {error}")
+        return None, False, error
 
     # 打包前运行验证
     print("🔍 正在验证技能...")
@@ -50,7 +410,7 @@ def package_skill(skill_path, output_dir=None):
     if not valid:
         print(f"❌ 验证失败：{message}")
         print("   请在打包前修复验证错误。")
-        return None
+        return None, False, f"验证失败：{message}"
     print(f"✅ {message}\n")
 
     # 确定输出位置
@@ -65,40 +425,193 @@ def package_skill(skill_path, output_dir=None):
 
     # 创建 .skill 文件（zip 格式）
     try:
-        with zipfile.ZipFile(skill_filename, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            # 遍历技能目录
-            for file_path in skill_path.rglob('*'):
-                if file_path.is_file():
-                    # 计算 zip 中的相对路径
-                    arcname = file_path.relative_to(skill_path.parent)
-                    zipf.write(file_path, arcname)
-                    print(f"  已添加：{arcname}")
+        file_paths = list_skill_files(skill_path)
+        problems = check_size_budget(skill_path, file_paths, max_file_size, max_total_size)
+        if problems:
+            print("❌ 超出大小预算，未创建 .skill 文件：")
+            for line in problems:
+                print(line)
+            print("   请用 .skillignore 排除不需要分发的文件，或调整大小预算。")
+            return None, False, "超出大小预算，未创建 .skill 文件"
+
+        manifest, files = build_manifest(skill_path, file_paths)
+        manifest["deterministic"] = deterministic
+        manifest_arcname = f"{skill_name}/{MANIFEST_NAME}"
+
+        previous = read_manifest(skill_filename, skill_name) if incremental else None
+        if previous is not None and previous == manifest:
+            print(f"✅ 内容未变化，跳过打包：{skill_filename}")
+            print(f"   SHA-256：{file_sha256(skill_filename)}")
+            return skill_filename, True, None
+        unchanged = {
+            arcname for arcname, entry in manifest["files"].items()
+            if previous is not None and previous.get("files", {}).get(arcname) == entry
+        }
+
+        # 先写入临时文件再替换，增量模式下旧文件在写入期间仍可读取
+        tmp_filename = skill_filename.with_name(skill_filename.name + ".tmp")
+        source = zipfile.ZipFile(skill_filename) if unchanged else None
+        date_time = fixed_date_time() if deterministic else None
+        try:
+            with zipfile.ZipFile(tmp_filename, 'w', zipfile.ZIP_DEFLATED) as zipf:
+                for arcname, file_path in files.items():
+                    if arcname in unchanged:
+                        mode = normalized_mode(file_path) if deterministic else None
+                        copy_compressed_entry(source, zipf, source.getinfo(arcname), date_time, mode)
+                        print(f"  未变化：{arcname}")
+                    elif deterministic:
+                        info = deterministic_info(arcname, file_path, date_time)
+                        info.file_size = file_path.stat().st_size
+                        with open(file_path, 'rb') as src, zipf.open(info, 'w') as dest:
+                            shutil.copyfileobj(src, dest, 1 << 20)
+                        print(f"  已添加：{arcname}")
+                    else:
+                        zipf.write(file_path, arcname, compress_type=compression_for(file_path))
+                        print(f"  已添加：{arcname}")
+                manifest_data = json.dumps(manifest, indent=2, sort_keys=True)
+                if deterministic:
+                    zipf.writestr(deterministic_info(manifest_arcname, None, date_time), manifest_data)
+                else:
+                    zipf.writestr(manifest_arcname, manifest_data)
+        except BaseException:
+            tmp_filename.unlink(missing_ok=True)
+            raise
+        finally:
+            if source is not None:
+                source.close()
+        os.replace(tmp_filename, skill_filename)
 
         print(f"\n✅ 技能已成功打包到：{skill_filename}")
-        return skill_filename
+        print(f"   SHA-256：{file_sha256(skill_filename)}")
+        return skill_filename, False, None
 
     except Exception as e:
-        print(f"❌ 创建 .skill 文件时出错：{e}")
-        return None
+        error = f"创建 .skill 文件时出错：{e}"
+        print(f"❌ {error}")
+        return None, False, error
+
+
+def _package_worker(skill_path, output_dir, options):
+    """在工作进程中打包一个技能；日志输出被丢弃以免各进程交错，结果以结构化状态返回。"""
+    start_ts = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result, skipped, error = _package_skill(skill_path, output_dir, **options)
+    return {
+        "skill": Path(skill_path).name,
+        "path": str(result) if result else None,
+        "size": Path(result).stat().st_size if result else 0,
+        "sha256": file_sha256(result) if result else None,
+        "seconds": time.perf_counter() - start_ts,
+        "skipped": skipped,
+        "error": error,
+    }
+
+
+def format_size(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def package_all(root, output_dir=None, jobs=None, **options):
+    """
+    并行打包 root 下的所有技能。
+
+    参数：
+        root: 要搜索技能的根目录
+        output_dir: .skill 文件的输出目录（默认为当前目录）
+        options: 传给 package_skill 的选项（incremental、deterministic 和大小预算）
+        jobs: 工作进程数（默认为 CPU 核数）
+
+    返回：
+        每个技能的结果列表，包含 skill、path、size、sha256、seconds、skipped 和 error
+    """
+    skills = find_skills(root)
+    results = []
+    # 输出文件以目录名命名，同名技能会互相覆盖
+    by_name = {}
+    for skill_dir in skills:
+        if skill_dir.name in by_name:
+            results.append({
+                "skill": skill_dir.name, "path": None, "size": 0, "sha256": None, "seconds": 0.0, "skipped": False,
+                "error": f"与 {by_name[skill_dir.name]} 同名，输出文件会互相覆盖",
+            })
+        else:
+            by_name[skill_dir.name] = skill_dir
+
+    print(f"📦 在 {root} 中找到 {len(skills)} 个技能，使用 {jobs or os.cpu_count()} 个进程打包\n")
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(_package_worker, skill_dir, output_dir, options) for skill_dir in by_name.values()]
+        for future in futures:
+            result = future.result()
+            status = "❌" if result["path"] is None else "✅"
+            print(f"{status} {result['skill']}（{result['seconds']:.2f}s）")
+            results.append(result)
+    return sorted(results, key=lambda r: r["skill"])
+
+
+def print_summary(results):
+    """输出每个技能的打包结果表格。"""
+    print("\n| 技能 | 状态 | 大小 | 耗时 (s) | SHA-256 |")
+    print("|---|---|---|---|---|")
+    for r in results:
+        if r["path"] is None:
+            status = "❌ 失败"
+        elif r["skipped"]:
+            status = "⏩ 未变化"
+        else:
+            status = "✅ 已打包"
+        size = format_size(r["size"]) if r["path"] else "-"
+        sha256 = r["sha256"][:16] if r["sha256"] else "-"
+        print(f"| {r['skill']} | {status} | {size} | {r['seconds']:.2f} | {sha256} |")
+
+    failed = [r for r in results if r["path"] is None]
+    for r in failed:
+        print(f"\n{r['skill']}：❌ {r['error'] or '打包失败'}")
+    total = sum(r["size"] for r in results)
+    print(f"\n共 {len(results)} 个技能，失败 {len(failed)} 个，总大小 {format_size(total)}")
 
 
 def main():
-    if len(sys.argv) < 2:
-        print("用法：python utils/package_skill.py <path/to/skill-folder> [output-directory]")
-        print("\n示例：")
-        print("  python utils/package_skill.py skills/public/my-skill")
-        print("  python utils/package_skill.py skills/public/my-skill ./dist")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="将技能文件夹打包成 .skill 文件")
+    parser.add_argument("paths", nargs="*", metavar="PATH", help="<技能文件夹> [输出目录]；使用 --all 时只给 [输出目录]")
+    parser.add_argument("--all", metavar="ROOT", dest="root", help="并行打包 ROOT 下所有包含 SKILL.md 的技能")
+    parser.add_argument("-j", "--jobs", type=int, help="--all 模式的工作进程数（默认：CPU 核数）")
+    parser.add_argument("--incremental", action="store_true", help="内容未变化时跳过打包，否则只重新压缩变化的文件")
+    parser.add_argument("--deterministic", action="store_true", help="生成可复现的归档：排序条目、固定时间戳和权限")
+    parser.add_argument("--max-file-size", type=parse_size, metavar="SIZE", help="单个文件的大小上限，例如 5MB")
+    parser.add_argument("--max-total-size", type=parse_size, metavar="SIZE", help="所有文件的总大小上限（未压缩），例如 50MB")
+    args = parser.parse_args()
+    options = dict(
+        incremental=args.incremental,
+        deterministic=args.deterministic,
+        max_file_size=args.max_file_size,
+        max_total_size=args.max_total_size,
+    )
+
+    if args.root:
+        if len(args.paths) > 1:
+            parser.error("使用 --all 时只能再指定一个输出目录")
+        results = package_all(args.root, args.paths[0] if args.paths else None, args.jobs, **options)
+        if not results:
+            print(f"❌ 错误：在 {args.root} 中未找到包含 SKILL.md 的技能")
+            sys.exit(1)
+        print_summary(results)
+        sys.exit(1 if any(r["path"] is None for r in results) else 0)
 
-    skill_path = sys.argv[1]
-    output_dir = sys.argv[2] if len(sys.argv) > 2 else None
+    if not 1 <= len(args.paths) <= 2:
+        parser.error("需要 <技能文件夹> [输出目录]")
+    skill_path = args.paths[0]
+    output_dir = args.paths[1] if len(args.paths) > 1 else None
 
     print(f"📦 正在打包技能：{skill_path}")
     if output_dir:
         print(f"   输出目录：{output_dir}")
     print()
 
-    result = package_skill(skill_path, output_dir)
+    result = package_skill(skill_path, output_dir, **options)
 
     if result:
         sys.exit(0)
@@ -1,32 +1,55 @@
 #!/usr/bin/env python3
 """
 技能快速验证脚本 - 精简版
+
+用法：
+    python quick_validate.py <skill_directory>
+    python quick_validate.py --all <root> [--json] [-j JOBS] [--cache PATH]
+
+--all 模式并行验证 <root> 下所有包含 SKILL.md 的技能，列出每个技能的全部错误，
+--json 输出机器可读的结果。--cache 记录每个技能 SKILL.md 的修改时间、大小和
+内容哈希，下次运行时跳过未变化的技能。
 """
 
+import argparse
+import hashlib
+import json
 import sys
 import os
 import re
 import yaml
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-def validate_skill(skill_path):
-    """技能基本验证"""
+# 定义允许的属性
+ALLOWED_PROPERTIES = {'name', 'description', 'license', 'allowed-tools', 'metadata'}
+
+CACHE_VERSION = 1
+
+
+def collect_errors(skill_path):
+    """技能基本验证，返回全部错误消息的列表（有效时为空列表）"""
     skill_path = Path(skill_path)
 
     # 检查 SKILL.md 是否存在
     skill_md = skill_path / 'SKILL.md'
     if not skill_md.exists():
-        return False, "未找到 SKILL.md"
+        return ["未找到 SKILL.md"]
 
     # 读取并验证前置元数据
-    content = skill_md.read_text(encoding='utf-8')
+    try:
+        content = skill_md.read_text(encoding='utf-8')
+    except UnicodeDecodeError as e:
+        return [f"SKILL.md 不是有效的 UTF-8 文本：{e}"]
+    except OSError as e:
+        return [f"无法读取 SKILL.md：{e}"]
     if not content.startswith('---'):
-        return False, "未找到 YAML 前置元数据"
+        return ["未找到 YAML 前置元数据"]
 
     # 提取前置元数据
     match = re.match(r'^---\n(.*?)\n---', content, re.DOTALL)
     if not match:
-        return False, "前置元数据格式无效"
+        return ["前置元数据格式无效"]
 
     frontmatter_text = match.group(1)
 
@@ -34,62 +57,241 @@ def validate_skill(skill_path):
     try:
         frontmatter = yaml.safe_load(frontmatter_text)
         if not isinstance(frontmatter, dict):
-            return False, "前置元数据必须是 YAML 字典"
+            return ["前置元数据必须是 YAML 字典"]
     except yaml.YAMLError as e:
-        return False, f"前置元数据中的 YAML 无效：{e}"
+        return [f"前置元数据中的 YAML 无效：{e}"]
 
-    # 定义允许的属性
-    ALLOWED_PROPERTIES = {'name', 'description', 'license', 'allowed-tools', 'metadata'}
+    # 前置元数据解析成功后，其余检查互不依赖，收集全部错误
+    errors = []
 
     # 检查意外属性（不包括 metadata 下的嵌套键）
     unexpected_keys = set(frontmatter.keys()) - ALLOWED_PROPERTIES
     if unexpected_keys:
-        return False, (
+        errors.append(
             f"SKILL.md 前置元数据中有意外的键：{', '.join(sorted(unexpected_keys))}。"
             f"允许的属性有：{', '.join(sorted(ALLOWED_PROPERTIES))}"
         )
 
     # 检查必需字段
     if 'name' not in frontmatter:
-        return False, "前置元数据中缺少 'name'"
+        errors.append("前置元数据中缺少 'name'")
     if 'description' not in frontmatter:
-        return False, "前置元数据中缺少 'description'"
+        errors.append("前置元数据中缺少 'description'")
 
     # 提取名称进行验证
     name = frontmatter.get('name', '')
     if not isinstance(name, str):
-        return False, f"名称必须是字符串，得到的是 {type(name).__name__}"
+        errors.append(f"名称必须是字符串，得到的是 {type(name).__name__}")
+        name = ''
     name = name.strip()
     if name:
         # 检查命名约定（连字符分隔：小写字母和连字符）
         if not re.match(r'^[a-z0-9-]+$', name):
-            return False, f"名称 '{name}' 应该是连字符分隔的（仅限小写字母、数字和连字符）"
+            errors.append(f"名称 '{name}' 应该是连字符分隔的（仅限小写字母、数字和连字符）")
         if name.startswith('-') or name.endswith('-') or '--' in name:
-            return False, f"名称 '{name}' 不能以连字符开头/结尾或包含连续连字符"
+            errors.append(f"名称 '{name}' 不能以连字符开头/结尾或包含连续连字符")
         # 检查名称长度（根据规范最多 64 个字符）
         if len(name) > 64:
-            return False, f"名称太长（{len(name)} 个字符）。最多 64 个字符。"
+            errors.append(f"名称太长（{len(name)} 个字符）。最多 64 个字符。")
 
     # 提取并验证描述
     description = frontmatter.get('description', '')
     if not isinstance(description, str):
-        return False, f"描述必须是字符串，得到的是 {type(description).__name__}"
+        errors.append(f"描述必须是字符串，得到的是 {type(description).__name__}")
+        description = ''
     description = description.strip()
     if description:
         # 检查尖括号
         if '<' in description or '>' in description:
-            return False, "描述不能包含尖括号（< 或 >）"
+            errors.append("描述不能包含尖括号（< 或 >）")
         # 检查描述长度（根据规范最多 1024 个字符）
         if len(description) > 1024:
-            return False, f"描述太长（{len(description)} 个字符）。最多 1024 个字符。"
+            errors.append(f"描述太长（{len(description)} 个字符）。最多 1024 个字符。")
+
+    return errors
+
 
+def validate_skill(skill_path):
+    """技能基本验证，返回 (是否有效, 第一个错误或成功消息)"""
+    errors = collect_errors(skill_path)
+    if errors:
+        return False, errors[0]
     return True, "技能有效！"
 
-if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("用法：python quick_validate.py <skill_directory>")
+
+def find_skills(root):
+    """
+    查找 root 下所有包含 SKILL.md 的技能目录。
+
+    技能目录内部的 SKILL.md（例如作为模板的资源文件）不视为独立的技能。
+    """
+    root = Path(root).resolve()
+    skills = []
+    # 按深度从浅到深处理，外层技能总是先于其内部的 SKILL.md 被找到
+    # （按路径排序时 my-skill/Assets 会排在 my-skill/SKILL.md 之前）
+    for skill_md in sorted(root.rglob('SKILL.md'), key=lambda path: (len(path.parts), path)):
+        skill_dir = skill_md.parent
+        # 只检查 root 之下的部分，root 本身可以位于 .codebuddy/skills 这样的隐藏目录中
+        if any(part.startswith('.') or part == '__pycache__' for part in skill_dir.relative_to(root).parts):
+            continue
+        if any(skill_dir.is_relative_to(found) for found in skills):
+            continue
+        skills.append(skill_dir)
+    return sorted(skills)
+
+
+def validator_fingerprint():
+    """验证脚本自身的哈希，脚本更新后缓存自动失效"""
+    return hashlib.sha256(Path(__file__).read_bytes()).hexdigest()
+
+
+def skill_md_state(skill_path):
+    """SKILL.md 的 (mtime_ns, size)，文件不存在时为 None"""
+    try:
+        stat = (Path(skill_path) / 'SKILL.md').stat()
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def skill_md_sha256(skill_path):
+    try:
+        return hashlib.sha256((Path(skill_path) / 'SKILL.md').read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+
+def load_cache(cache_path):
+    """读取验证缓存；文件不存在、损坏或验证脚本已更新时返回空缓存"""
+    try:
+        data = json.loads(Path(cache_path).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+    if data.get('version') != CACHE_VERSION or data.get('validator') != validator_fingerprint():
+        return {}
+    return data.get('skills', {})
+
+
+def save_cache(cache_path, entries):
+    cache_path = Path(cache_path)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_name(cache_path.name + '.tmp')
+    tmp_path.write_text(
+        json.dumps({'version': CACHE_VERSION, 'validator': validator_fingerprint(), 'skills': entries}, ensure_ascii=False),
+        encoding='utf-8',
+    )
+    os.replace(tmp_path, cache_path)
+
+
+def _validate_worker(skill_path):
+    """在工作进程中验证一个技能，同时记录缓存所需的文件状态"""
+    return {
+        'errors': collect_errors(skill_path),
+        'state': skill_md_state(skill_path),
+        'sha256': skill_md_sha256(skill_path),
+    }
+
+
+def validate_all(root, jobs=None, cache_path=None):
+    """
+    并行验证 root 下的所有技能。
+
+    参数：
+        root: 要搜索技能的根目录
+        jobs: 工作进程数（默认为 CPU 核数）
+        cache_path: 验证缓存文件；SKILL.md 的修改时间和大小未变，或内容哈希未变时
+            直接使用缓存的结果
+
+    返回：
+        每个技能的结果列表，包含 path、name、valid、errors 和 cached
+    """
+    cache = load_cache(cache_path) if cache_path else {}
+    results = {}
+    pending = []
+    for skill_dir in find_skills(root):
+        key = str(skill_dir)
+        cached = cache.get(key)
+        if cached is not None:
+            state = skill_md_state(skill_dir)
+            # 只是修改时间变化（例如重新检出）时，按内容哈希确认
+            if cached['state'] == state or (state is not None and cached['sha256'] == skill_md_sha256(skill_dir)):
+                cached['state'] = state
+                results[key] = {'errors': cached['errors'], 'cached': True}
+                continue
+        pending.append(skill_dir)
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            for skill_dir, outcome in zip(pending, pool.map(_validate_worker, pending)):
+                cache[str(skill_dir)] = outcome
+                results[str(skill_dir)] = {'errors': outcome['errors'], 'cached': False}
+
+    if cache_path:
+        # 只保留仍然存在的技能
+        save_cache(cache_path, {key: cache[key] for key in results})
+
+    return [
+        {
+            'path': key,
+            'name': Path(key).name,
+            'valid': not result['errors'],
+            'errors': result['errors'],
+            'cached': result['cached'],
+        }
+        for key, result in sorted(results.items())
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="验证技能文件夹")
+    parser.add_argument('skill_directory', nargs='?', help="技能文件夹路径")
+    parser.add_argument('--all', metavar='ROOT', dest='root', help="并行验证 ROOT 下所有包含 SKILL.md 的技能")
+    parser.add_argument('-j', '--jobs', type=int, help="--all 模式的工作进程数（默认：CPU 核数）")
+    parser.add_argument('--json', action='store_true', help="输出 JSON 格式的结果")
+    parser.add_argument('--cache', type=Path, metavar='PATH', help="验证缓存文件，跳过未变化的技能")
+    args = parser.parse_args()
+
+    if args.root:
+        results = validate_all(args.root, args.jobs, args.cache)
+    elif args.skill_directory:
+        errors = collect_errors(args.skill_directory)
+        results = [{
+            'path': str(Path(args.skill_directory).resolve()),
+            'name': Path(args.skill_directory).resolve().name,
+            'valid': not errors,
+            'errors': errors,
+            'cached': False,
+        }]
+    else:
+        parser.error("需要 <skill_directory> 或 --all <root>")
+
+    invalid = [r for r in results if not r['valid']]
+    if args.json:
+        print(json.dumps({
+            'skills': results,
+            'summary': {
+                'total': len(results),
+                'valid': len(results) - len(invalid),
+                'invalid': len(invalid),
+                'cached': sum(1 for r in results if r['cached']),
+            },
+        }, ensure_ascii=False, indent=2))
+    elif args.root:
+        for r in results:
+            print(f"{'✅' if r['valid'] else '❌'} {r['name']}{'（缓存）' if r['cached'] else ''}")
+            for error in r['errors']:
+                print(f"   - {error}")
+        print(f"\n共 {len(results)} 个技能，无效 {len(invalid)} 个，"
+              f"使用缓存 {sum(1 for r in results if r['cached'])} 个")
+    else:
+        errors = results[0]['errors']
+        print("\n".join(errors) if errors else "技能有效！")
+
+    if args.root and not results:
+        print(f"❌ 错误：在 {args.root} 中未找到包含 SKILL.md 的技能", file=sys.stderr)
         sys.exit(1)
-    
-    valid, message = validate_skill(sys.argv[1])
-    print(message)
-    sys.exit(0 if valid else 1)
+    sys.exit(1 if invalid else 0)
+
+
+if __name__ == "__main__":
+    main()